@@ -0,0 +1,207 @@
+// Gráficos desenhados no navegador (APRENDIZAP_CHART_MODE=client).
+// O servidor envia apenas os agregados de cada gráfico (rótulos, séries e cores) e este
+// arquivo desenha barras e linhas num <canvas>, sem bibliotecas externas. Mudanças de
+// tamanho da janela são redesenhadas localmente, sem nova ida ao servidor.
+(function () {
+  var FONT = 'Arial, "DejaVu Sans", sans-serif';
+  var MARGIN = { top: 56, right: 16, bottom: 56, left: 64 };
+
+  function formatNumber(value) {
+    if (Math.abs(value) < 1 && value !== 0) {
+      return value.toLocaleString('pt-BR', { maximumFractionDigits: 2 });
+    }
+    return Math.round(value).toLocaleString('pt-BR');
+  }
+
+  // Escala "redonda" do eixo Y: até ~5 divisões de 1, 2 ou 5 × 10^n
+  function niceTicks(max) {
+    if (!(max > 0)) { return { max: 1, step: 0.2 }; }
+    var raw = max / 5;
+    var power = Math.pow(10, Math.floor(Math.log10(raw)));
+    var step = [1, 2, 5, 10].map(function (m) { return m * power; })
+      .find(function (s) { return s >= raw; });
+    return { max: Math.ceil(max / step) * step, step: step };
+  }
+
+  function drawText(ctx, text, x, y, options) {
+    ctx.save();
+    ctx.font = (options.weight || 'normal') + ' ' + (options.size || 12) + 'px ' + FONT;
+    ctx.fillStyle = options.color || '#333';
+    ctx.textAlign = options.align || 'center';
+    ctx.textBaseline = options.baseline || 'middle';
+    if (options.rotate) {
+      ctx.translate(x, y);
+      ctx.rotate(options.rotate);
+      x = 0;
+      y = 0;
+    }
+    String(text).split('\n').forEach(function (line, i) {
+      ctx.fillText(line, x, y + i * ((options.size || 12) + 4));
+    });
+    ctx.restore();
+  }
+
+  function drawLegend(ctx, series, x, y) {
+    series.forEach(function (s, i) {
+      ctx.fillStyle = s.color;
+      ctx.fillRect(x, y + i * 18 - 5, 10, 10);
+      drawText(ctx, s.name, x + 16, y + i * 18, { align: 'left', size: 11 });
+    });
+  }
+
+  function draw(el) {
+    var spec = el._spec;
+    var canvas = el.querySelector('canvas');
+    if (!spec || !canvas) { return; }
+    var width = el.clientWidth;
+    var height = el.clientHeight;
+    var ratio = window.devicePixelRatio || 1;
+    canvas.width = width * ratio;
+    canvas.height = height * ratio;
+    canvas.style.width = width + 'px';
+    canvas.style.height = height + 'px';
+    var ctx = canvas.getContext('2d');
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    ctx.clearRect(0, 0, width, height);
+
+    drawText(ctx, spec.title || '', width / 2, 24, { size: 16, weight: '600', color: '#8A2BE2' });
+    if (spec.message) {
+      drawText(ctx, spec.message, width / 2, height / 2, { size: 14 });
+      return;
+    }
+
+    var series = spec.series || [];
+    var labels = spec.labels || [];
+    var legend = series.length > 1;
+    var plot = {
+      left: MARGIN.left,
+      top: MARGIN.top,
+      right: width - MARGIN.right - (legend ? 130 : 0),
+      bottom: height - MARGIN.bottom
+    };
+    var plotWidth = plot.right - plot.left;
+    var plotHeight = plot.bottom - plot.top;
+    if (plotWidth <= 0 || plotHeight <= 0 || labels.length === 0) { return; }
+
+    // Eixo Y
+    var dataMax = 0;
+    labels.forEach(function (_, i) {
+      var total = 0;
+      series.forEach(function (s) {
+        total = spec.stacked ? total + s.values[i] : Math.max(total, s.values[i]);
+      });
+      dataMax = Math.max(dataMax, total);
+    });
+    var ticks = niceTicks(spec.ymax || dataMax * 1.15);
+    var yMax = spec.ymax || ticks.max;
+    function yOf(value) { return plot.bottom - (value / yMax) * plotHeight; }
+
+    ctx.strokeStyle = 'rgba(0, 0, 0, 0.1)';
+    ctx.lineWidth = 1;
+    for (var t = 0; t <= yMax + 1e-9; t += ticks.step) {
+      var y = Math.round(yOf(t)) + 0.5;
+      ctx.beginPath();
+      ctx.moveTo(plot.left, y);
+      ctx.lineTo(plot.right, y);
+      ctx.stroke();
+      drawText(ctx, formatNumber(t), plot.left - 6, y, { align: 'right', size: 11 });
+    }
+    ctx.strokeStyle = '#ccc';
+    ctx.beginPath();
+    ctx.moveTo(plot.left + 0.5, plot.top);
+    ctx.lineTo(plot.left + 0.5, plot.bottom + 0.5);
+    ctx.lineTo(plot.right, plot.bottom + 0.5);
+    ctx.stroke();
+    drawText(ctx, spec.ylabel || '', 16, (plot.top + plot.bottom) / 2, { rotate: -Math.PI / 2 });
+    drawText(ctx, spec.xlabel || '', (plot.left + plot.right) / 2, height - 14, {});
+
+    // Eixo X
+    var slot = plotWidth / labels.length;
+    function xOf(i) { return plot.left + slot * (i + 0.5); }
+    var xticks = spec.xticks || labels.map(function (_, i) { return i; });
+    xticks.forEach(function (i) {
+      drawText(ctx, labels[i], xOf(i), plot.bottom + 14, { size: 11 });
+    });
+
+    if (spec.kind === 'line') {
+      if (spec.marker) {
+        var mi = labels.indexOf(spec.marker.at);
+        if (mi >= 0) {
+          ctx.save();
+          ctx.strokeStyle = spec.marker.color;
+          ctx.lineWidth = 2;
+          ctx.setLineDash([6, 4]);
+          ctx.beginPath();
+          ctx.moveTo(xOf(mi), plot.top);
+          ctx.lineTo(xOf(mi), plot.bottom);
+          ctx.stroke();
+          ctx.restore();
+          drawText(ctx, spec.marker.label, xOf(mi) + 10, plot.top + 4,
+                   { rotate: Math.PI / 2, align: 'left', weight: 'bold', size: 10, color: spec.marker.color });
+        }
+      }
+      series.forEach(function (s) {
+        ctx.strokeStyle = s.color;
+        ctx.fillStyle = s.color;
+        ctx.lineWidth = 2.5;
+        ctx.beginPath();
+        s.values.forEach(function (v, i) {
+          if (i === 0) { ctx.moveTo(xOf(i), yOf(v)); } else { ctx.lineTo(xOf(i), yOf(v)); }
+        });
+        ctx.stroke();
+        s.values.forEach(function (v, i) {
+          ctx.beginPath();
+          ctx.arc(xOf(i), yOf(v), 3, 0, 2 * Math.PI);
+          ctx.fill();
+        });
+      });
+    } else {
+      var groups = spec.stacked ? 1 : series.length;
+      var barWidth = slot * 0.8 / groups;
+      var bottoms = labels.map(function () { return 0; });
+      series.forEach(function (s, k) {
+        var seriesTotal = s.values.reduce(function (a, b) { return a + b; }, 0);
+        s.values.forEach(function (v, i) {
+          var x = xOf(i) - slot * 0.4 + (spec.stacked ? 0 : k * barWidth);
+          var base = spec.stacked ? bottoms[i] : 0;
+          ctx.globalAlpha = 0.8;
+          ctx.fillStyle = s.colors ? s.colors[i] : s.color;
+          ctx.fillRect(x, yOf(base + v), barWidth, yOf(base) - yOf(base + v));
+          ctx.globalAlpha = 1;
+          if (spec.value_labels) {
+            drawText(ctx, formatNumber(v), x + barWidth / 2, yOf(base + v) - 8, { weight: '600', size: 11 });
+          }
+          if (spec.percent_labels && seriesTotal > 0) {
+            drawText(ctx, (v / seriesTotal * 100).toFixed(1) + '%', x + barWidth / 2,
+                     yOf(base + v / 2), { weight: '600', size: 11, color: 'white' });
+          }
+          bottoms[i] += v;
+        });
+      });
+    }
+
+    if (legend) {
+      drawLegend(ctx, series, plot.right + 16, plot.top + 8);
+    }
+  }
+
+  var binding = new Shiny.OutputBinding();
+  $.extend(binding, {
+    find: function (scope) {
+      return $(scope).find('.aprendizap-chart');
+    },
+    renderValue: function (el, spec) {
+      if (!el.querySelector('canvas')) {
+        var canvas = document.createElement('canvas');
+        canvas.style.display = 'block';
+        el.appendChild(canvas);
+        if (window.ResizeObserver) {
+          new ResizeObserver(function () { draw(el); }).observe(el);
+        }
+      }
+      el._spec = spec;
+      draw(el);
+    }
+  });
+  Shiny.outputBindings.register(binding, 'aprendizap.chart');
+})();
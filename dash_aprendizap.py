@@ -1,11 +1,47 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from shiny import App, render, ui, reactive
+from shiny.render.renderer import Renderer
+from shiny.types import SilentCancelOutputException, SilentException
 import base64
 import matplotlib.font_manager as fm
 import os
+import asyncio
+import functools
+import multiprocessing
+import pickle
 import gc
+import time
+import hashlib
+import html
+import json
+import logging
+import threading
+import warnings
+import weakref
+import tempfile
+import shutil
+from collections import OrderedDict
+from types import GeneratorType, MappingProxyType
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import plot_worker
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Avisos de operação (snapshot, estruturas derivadas, pool de rasterização); sem
+# configuração, vão para o stderr
+logger = logging.getLogger(__name__)
 
 # ======================================================================================
 # 1. PREPARAÇÃO DOS DADOS
@@ -15,6 +51,47 @@ import gc
 # Exemplo: df_users = pd.read_parquet('caminho/para/seus/dados.parquet')
 # ======================================================================================
 
+# Variáveis inteiras usadas nos critérios RUP
+RUP_COLUMNS = ['sessions_days', 'weeks_active', 'events_total', 'days_active', 'features_distinct']
+
+# Colunas efetivamente usadas pelo dashboard (projeção na leitura dos parquets)
+USER_COLUMNS = ['unique_id', 'uid', 'first_seen'] + RUP_COLUMNS
+INTERACTION_COLUMNS = ['unique_id', 'numero_interacao', 'user_agent_device_type', 'event_classification']
+
+USERS_PATH = 'Dados/usuarios_RUP_reduzido.parquet'
+INTERACTIONS_PATH = 'Dados/fct_teachers_contents_interactions_classified_2_reduzido.parquet'
+
+# Maior valor do slider "Analisar X primeiras interações": interações posteriores nunca são usadas
+FIRST_INTERACTIONS_MAX = 100
+
+def read_users(path):
+    """Lê os usuários via pyarrow.dataset, projetando apenas as colunas usadas"""
+    dataset = ds.dataset(path, format='parquet')
+    columns = [col for col in USER_COLUMNS if col in dataset.schema.names]
+    return dataset.to_table(columns=columns).to_pandas()
+
+def read_interactions(path, max_interaction=None):
+    """Lê as interações via pyarrow.dataset em lotes, com projeção de colunas, filtro de
+    numero_interacao avaliado nas estatísticas dos row groups e strings codificadas em dicionário"""
+    dataset = ds.dataset(path, format='parquet')
+    columns = [col for col in INTERACTION_COLUMNS if col in dataset.schema.names]
+    row_filter = None
+    if max_interaction is not None and 'numero_interacao' in columns:
+        row_filter = ds.field('numero_interacao') <= max_interaction
+
+    scanner = dataset.scanner(columns=columns, filter=row_filter)
+    batches = []
+    for batch in scanner.to_batches():
+        # Codificar strings lote a lote para nunca materializar a coluna inteira como texto
+        arrays = [
+            col.dictionary_encode() if pa.types.is_string(col.type) or pa.types.is_large_string(col.type) else col
+            for col in batch.columns
+        ]
+        batches.append(pa.RecordBatch.from_arrays(arrays, names=batch.schema.names))
+    if not batches:
+        return scanner.projected_schema.empty_table().to_pandas()
+    return pa.Table.from_batches(batches).unify_dictionaries().to_pandas()
+
 # Tentar carregar dados reais, se não existir, criar dados de demonstração
 print("🔍 Verificando arquivos de dados...")
 print(f"📁 Diretório atual: {os.getcwd()}")
@@ -24,49 +101,769 @@ if os.path.exists('Dados'):
 else:
     print("❌ Diretório Dados não existe!")
 
-try:
-    print("🔄 Tentando carregar usuarios_RUP_reduzido.parquet...")
-    df_users = pd.read_parquet('Dados/usuarios_RUP_reduzido.parquet')
-    print(f"✅ usuarios_RUP_reduzido.parquet carregado: {len(df_users)} registros")
+def load_source_data():
+    """Carrega os parquets de origem ou, se não existirem, cria dados de demonstração"""
+    try:
+        print("🔄 Tentando carregar usuarios_RUP_reduzido.parquet...")
+        df_users = read_users(USERS_PATH)
+        print(f"✅ usuarios_RUP_reduzido.parquet carregado: {len(df_users)} registros")
     
-    print("🔄 Tentando carregar fct_teachers_contents_interactions_classified_3_reduzido.parquet...")
-    df_interactions = pd.read_parquet('Dados/fct_teachers_contents_interactions_classified_2_reduzido.parquet', 
-                                     columns=['unique_id', 'numero_interacao', 'user_agent_device_type', 'event_classification'])
-    print(f"✅ fct_teachers_contents_interactions_classified_3_reduzido.parquet carregado: {len(df_interactions)} registros")
+        print("🔄 Tentando carregar fct_teachers_contents_interactions_classified_3_reduzido.parquet...")
+        df_interactions = read_interactions(INTERACTIONS_PATH, max_interaction=FIRST_INTERACTIONS_MAX)
+        print(f"✅ fct_teachers_contents_interactions_classified_3_reduzido.parquet carregado: {len(df_interactions)} registros")
     
-    print("✅ Dados reais carregados com sucesso")
-except Exception as e:
-    print(f"⚠️ Erro ao carregar dados reais: {e}")
-    print("📊 Criando dados de demonstração...")
+        print("✅ Dados reais carregados com sucesso")
+        return df_users, df_interactions
+    except Exception as e:
+        print(f"⚠️ Erro ao carregar dados reais: {e}")
+        print("📊 Criando dados de demonstração...")
     
-    # Criar dados de demonstração
-    np.random.seed(42)
-    n_users = 1000
+        # Criar dados de demonstração
+        np.random.seed(42)
+        n_users = 1000
     
-    df_users = pd.DataFrame({
-        'unique_id': [f'user_{i:04d}' for i in range(n_users)],
-        'sessions_days': np.random.randint(1, 30, n_users),
-        'weeks_active': np.random.randint(1, 12, n_users),
-        'events_total': np.random.randint(10, 500, n_users),
-        'days_active': np.random.randint(1, 20, n_users),
-        'features_distinct': np.random.randint(1, 8, n_users),
-        'first_seen': pd.date_range('2024-01-01', periods=n_users, freq='D'),
-        'state': np.random.choice(['SP', 'RJ', 'MG', 'RS', 'PR'], n_users),
-        'device_type': np.random.choice(['desktop', 'mobile', 'tablet'], n_users)
-    })
+        df_users = pd.DataFrame({
+            'unique_id': [f'user_{i:04d}' for i in range(n_users)],
+            'sessions_days': np.random.randint(1, 30, n_users),
+            'weeks_active': np.random.randint(1, 12, n_users),
+            'events_total': np.random.randint(10, 500, n_users),
+            'days_active': np.random.randint(1, 20, n_users),
+            'features_distinct': np.random.randint(1, 8, n_users),
+            'first_seen': pd.date_range('2024-01-01', periods=n_users, freq='D'),
+            'state': np.random.choice(['SP', 'RJ', 'MG', 'RS', 'PR'], n_users),
+            'device_type': np.random.choice(['desktop', 'mobile', 'tablet'], n_users)
+        })
     
-    n_interactions = 5000
-    df_interactions = pd.DataFrame({
-        'unique_id': np.random.choice(df_users['unique_id'], n_interactions),
-        'numero_interacao': range(1, n_interactions + 1),
-        'user_agent_device_type': np.random.choice(['desktop', 'mobile', 'tablet', 'smarttv'], n_interactions),
-        'event_classification': np.random.choice([
-            'Visualização e Acesso', 'Criação e Edição', 'Exportação e Download',
-            'Engajamento Social', 'Mari IA', 'Não Especificado'
-        ], n_interactions)
-    })
+        n_interactions = 5000
+        df_interactions = pd.DataFrame({
+            'unique_id': np.random.choice(df_users['unique_id'], n_interactions),
+            'user_agent_device_type': np.random.choice(['desktop', 'mobile', 'tablet', 'smarttv'], n_interactions),
+            'event_classification': np.random.choice([
+                'Visualização e Acesso', 'Criação e Edição', 'Exportação e Download',
+                'Engajamento Social', 'Mari IA', 'Não Especificado'
+            ], n_interactions)
+        })
+        # numero_interacao é a ordem da interação dentro de cada usuário, como nos dados reais
+        df_interactions['numero_interacao'] = df_interactions.groupby('unique_id').cumcount() + 1
     
-    print("✅ Dados de demonstração criados com sucesso")
+        print("✅ Dados de demonstração criados com sucesso")
+    return df_users, df_interactions
+
+# ======================================================================================
+# NORMALIZAÇÃO DOS DADOS NO CARREGAMENTO
+# first_seen é convertido uma única vez para datetime64[ns] sem timezone, com códigos
+# inteiros de mês e dia pré-calculados, e as variáveis RUP são reduzidas ao menor tipo
+# inteiro que comporta os valores. Os gráficos não precisam mais reprocessar datas.
+# ======================================================================================
+
+# Sentinelas para datas ausentes (NaT) nos códigos inteiros
+MONTH_CODE_NA = np.iinfo(np.int16).min
+DAY_CODE_NA = np.iinfo(np.int32).min
+
+NS_PER_DAY = 86_400 * 10**9
+
+def date_to_day_code(value):
+    """Converte uma data (date, string ou Timestamp) em dias desde 1970-01-01"""
+    return int(pd.Timestamp(value).value // NS_PER_DAY)
+
+def month_codes_to_periods(codes):
+    """Converte códigos de mês (ordinais de Period mensal) em PeriodIndex"""
+    return pd.PeriodIndex([pd.Period(ordinal=int(code), freq='M') for code in codes], name='period')
+
+def normalize_users(df):
+    """Normaliza df_users: identificador, first_seen sem timezone e tipos compactos"""
+    # Renomear coluna uid para unique_id se existir, senão criar usando o índice
+    if 'uid' in df.columns:
+        df = df.rename(columns={'uid': 'unique_id'})
+    elif 'unique_id' not in df.columns:
+        df = df.assign(unique_id=df.index.astype(str))
+
+    if 'first_seen' in df.columns:
+        first_seen = pd.to_datetime(df['first_seen'])
+        if first_seen.dt.tz is not None:
+            first_seen = first_seen.dt.tz_localize(None)
+        first_seen = first_seen.astype('datetime64[ns]')
+        missing = first_seen.isna().to_numpy()
+
+        # Código de mês = ordinal do Period mensal (meses desde 1970-01)
+        month_code = (first_seen.dt.year - 1970) * 12 + first_seen.dt.month - 1
+        month_code = np.where(missing, MONTH_CODE_NA, month_code.fillna(0)).astype(np.int16)
+
+        # Código de dia = dias desde 1970-01-01
+        day_code = first_seen.to_numpy().astype('datetime64[D]').astype(np.int64)
+        day_code = np.where(missing, DAY_CODE_NA, day_code).astype(np.int32)
+
+        df = df.assign(first_seen=first_seen, first_seen_month=month_code, first_seen_day=day_code)
+    else:
+        # Sem first_seen: códigos sempre presentes, todos com a sentinela de data ausente
+        df = df.assign(first_seen_month=np.full(len(df), MONTH_CODE_NA, dtype=np.int16),
+                       first_seen_day=np.full(len(df), DAY_CODE_NA, dtype=np.int32))
+
+    # Código inteiro do usuário (posição em USER_IDS), compartilhado com df_interactions
+    user_code, _ = pd.factorize(df['unique_id'])
+    df = df.assign(user_code=user_code.astype(np.int32))
+
+    # Reduzir as variáveis RUP ao menor inteiro que comporta os valores
+    downcast = {
+        col: pd.to_numeric(df[col], downcast='integer')
+        for col in RUP_COLUMNS if col in df.columns
+    }
+    return df.assign(**downcast)
+
+def normalize_interactions(df, user_ids):
+    """Codifica df_interactions em dicionário: user_code int32 e categorias compactas"""
+    df = df.copy()
+    if 'unique_id' in df.columns:
+        # Usuários sem cadastro em df_users ficam no fim das categorias e recebem user_code -1
+        unknown_ids = pd.Index(df['unique_id'].dropna().unique()).difference(user_ids)
+        unique_id = pd.Categorical(df['unique_id'], categories=user_ids.append(unknown_ids))
+        codes = unique_id.codes.astype(np.int32)
+        df['unique_id'] = unique_id
+        df['user_code'] = np.where(codes < len(user_ids), codes, -1).astype(np.int32)
+
+    for col in ['user_agent_device_type', 'event_classification']:
+        if col in df.columns:
+            # Categorias em ordem alfabética, independente da ordem do dicionário lido do parquet
+            values = df[col].astype('category')
+            df[col] = values.cat.reorder_categories(sorted(values.cat.categories))
+
+    if 'numero_interacao' in df.columns:
+        df['numero_interacao'] = pd.to_numeric(df['numero_interacao'], downcast='integer')
+    return df
+
+def prepare_data(df_users, df_interactions):
+    """Normaliza e codifica os dados carregados e ordena as interações por (user_code, numero_interacao)"""
+    df_users = normalize_users(df_users)
+
+    df_interactions = normalize_interactions(df_interactions, pd.Index(pd.unique(df_users['unique_id'].dropna())))
+
+    # Ordenação exigida pelo índice CSR por usuário (ver USER_OFFSETS)
+    if 'user_code' in df_interactions.columns:
+        sort_keys = ['user_code'] + (['numero_interacao'] if 'numero_interacao' in df_interactions.columns else [])
+        df_interactions = df_interactions.sort_values(sort_keys, kind='stable', ignore_index=True)
+    return df_users, df_interactions
+
+# ======================================================================================
+# SNAPSHOT PRÉ-PROCESSADO (ARROW IPC)
+# Os dados já normalizados e codificados são gravados em Arrow IPC, identificados pelo
+# tamanho e pelo rodapé (metadados: esquema, linhas, offsets e estatísticas dos row groups)
+# dos parquets de origem, lidos sem percorrer o conteúdo. A data de modificação não entra
+# na chave: o snapshot gerado no build continua válido quando os mesmos arquivos chegam
+# por um volume montado com outra data.
+# As estruturas derivadas (offsets CSR, cubo, somas de prefixo, bitmaps e índice RUP) são
+# gravadas ao lado, um .npy por array. Inicializações seguintes mapeiam o snapshot em
+# memória em vez de reler e reprocessar os parquets. Para gerá-lo no build da imagem,
+# basta importar o módulo (ver Dockerfile). Com vários workers (WEB_CONCURRENCY), todos
+# mapeiam os mesmos arquivos e apenas um deles gera o snapshot quando ele não existe.
+# ======================================================================================
+
+SNAPSHOT_DIR = os.environ.get('APRENDIZAP_SNAPSHOT_DIR', os.path.join('Dados', 'snapshot'))
+
+# Memória compartilhada (tmpfs) usada quando SNAPSHOT_DIR não aceita escrita. Em ambos os casos
+# cada worker mapeia os mesmos arquivos: as colunas numéricas, os códigos das categorias e as
+# estruturas derivadas (.npy somente leitura) apontam direto para o page cache, sem uma cópia
+# dos dados por processo.
+SHARED_SNAPSHOT_DIR = os.environ.get('APRENDIZAP_SHARED_DIR', '/dev/shm/aprendizap')
+
+# Incrementar sempre que a normalização ou as estruturas derivadas mudarem, invalidando snapshots antigos
+SNAPSHOT_VERSION = 1
+
+def parquet_footer(path):
+    """Rodapé de um arquivo parquet (metadados serializados que precedem o tamanho e 'PAR1')"""
+    with open(path, 'rb') as f:
+        f.seek(-8, os.SEEK_END)
+        length = int.from_bytes(f.read(4), 'little')
+        f.seek(-8 - length, os.SEEK_END)
+        return f.read(length)
+
+def source_data_key():
+    """Chave dos parquets de origem: tamanho e rodapé de cada arquivo (None se algum não existir
+    ou não puder ser lido)"""
+    if not all(os.path.isfile(path) for path in (USERS_PATH, INTERACTIONS_PATH)):
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"v{SNAPSHOT_VERSION}:{FIRST_INTERACTIONS_MAX}".encode())
+    try:
+        for path in (USERS_PATH, INTERACTIONS_PATH):
+            digest.update(f"{path}:{os.path.getsize(path)}:".encode())
+            digest.update(parquet_footer(path))
+    except OSError:
+        # Arquivo truncado ou ilegível: sem snapshot (a leitura dos dados trata o erro)
+        return None
+    return digest.hexdigest()
+
+def snapshot_paths(key, directory):
+    """Caminhos dos arquivos de snapshot de usuários e interações"""
+    return (os.path.join(directory, f'{key}_users.arrow'),
+            os.path.join(directory, f'{key}_interactions.arrow'))
+
+def save_snapshot(key, df_users, df_interactions):
+    """Grava o snapshot Arrow IPC de forma atômica no primeiro diretório que aceitar escrita"""
+    tables = [pa.Table.from_pandas(df, preserve_index=False) for df in (df_users, df_interactions)]
+    for directory in (SNAPSHOT_DIR, SHARED_SNAPSHOT_DIR):
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for path, table in zip(snapshot_paths(key, directory), tables):
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                os.replace(tmp_path, path)
+
+            # Remover snapshots (e estruturas derivadas) de versões anteriores dos dados
+            for name in os.listdir(directory):
+                if not name.startswith(key):
+                    path = os.path.join(directory, name)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif name.endswith('.arrow'):
+                        os.remove(path)
+            return True
+        except Exception as e:
+            logger.warning("Não foi possível gravar o snapshot em %s: %s", directory, e)
+    return False
+
+def load_snapshot(key):
+    """Mapeia em memória o snapshot correspondente à chave; retorna (usuários, interações, diretório)
+    ou (None, None, None) se não existir"""
+    for directory in (SNAPSHOT_DIR, SHARED_SNAPSHOT_DIR):
+        paths = snapshot_paths(key, directory)
+        if not all(os.path.exists(path) for path in paths):
+            continue
+        try:
+            frames = [
+                pa.ipc.open_file(pa.memory_map(path, 'r')).read_all().to_pandas(split_blocks=True)
+                for path in paths
+            ]
+            return frames[0], frames[1], directory
+        except Exception as e:
+            logger.warning("Snapshot inválido em %s: %s", directory, e)
+    return None, None, None
+
+def pack_arrays(value, arrays):
+    """Troca os arrays NumPy de uma estrutura (dicts, listas e escalares) por referências
+    numeradas, acumulando os arrays em `arrays`; o resultado é serializável em JSON"""
+    if isinstance(value, np.ndarray):
+        arrays.append(value)
+        return {'__array__': len(arrays) - 1}
+    if isinstance(value, dict):
+        return {key: pack_arrays(item, arrays) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [pack_arrays(item, arrays) for item in value]
+    return value
+
+def unpack_arrays(value, load):
+    """Inverso de pack_arrays: load(i) devolve o i-ésimo array"""
+    if isinstance(value, dict):
+        if '__array__' in value:
+            return load(value['__array__'])
+        return {key: unpack_arrays(item, load) for key, item in value.items()}
+    if isinstance(value, list):
+        return [unpack_arrays(item, load) for item in value]
+    return value
+
+def save_derived(path, value):
+    """Grava uma estrutura derivada (manifesto JSON + um .npy por array) de forma atômica"""
+    arrays = []
+    manifest = pack_arrays(value, arrays)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(tmp_path, exist_ok=True)
+        for i, array in enumerate(arrays):
+            np.save(os.path.join(tmp_path, f'{i}.npy'), array, allow_pickle=False)
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, default=int)
+        os.rename(tmp_path, path)
+    except Exception as e:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        # Outro worker pode ter gravado a mesma estrutura primeiro
+        if not os.path.isdir(path):
+            logger.warning("Não foi possível gravar %s: %s", os.path.basename(path), e)
+
+# Resultado de load_derived para estrutura ainda não gravada (None é um valor válido: "sem índice")
+DERIVED_MISSING = object()
+
+def load_derived(path):
+    """Mapeia em memória (somente leitura) uma estrutura derivada gravada por save_derived
+    (DERIVED_MISSING se não existir ou for inválida)"""
+    manifest_path = os.path.join(path, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return DERIVED_MISSING
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return unpack_arrays(manifest, lambda i: np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r'))
+    except Exception as e:
+        logger.warning("Estrutura derivada inválida em %s: %s", path, e)
+        return DERIVED_MISSING
+
+def derived(name, build):
+    """Estrutura derivada dos dados: lida do snapshot se existir; senão calculada com build()
+    e gravada ao lado do snapshot para as próximas inicializações"""
+    if snapshot_directory is None:
+        return build()
+    path = os.path.join(snapshot_directory, f'{snapshot_key}_{name}')
+    value = load_derived(path)
+    if value is DERIVED_MISSING:
+        value = build()
+        save_derived(path, value)
+        # Reabrir a partir dos arquivos para compartilhar as páginas com os demais workers
+        shared = load_derived(path)
+        if shared is not DERIVED_MISSING:
+            value = shared
+    return value
+
+@contextmanager
+def snapshot_build_lock(key):
+    """Trava entre processos: um único worker gera o snapshot enquanto os demais aguardam"""
+    if fcntl is None:
+        yield
+        return
+    lock_path = os.path.join(tempfile.gettempdir(), f'aprendizap_snapshot_{key}.lock')
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Diretório de onde o snapshot foi carregado (None sem snapshot): as estruturas derivadas ficam nele
+snapshot_directory = None
+snapshot_key = source_data_key()
+if snapshot_key:
+    df_users, df_interactions, snapshot_directory = load_snapshot(snapshot_key)
+    if df_users is None:
+        with snapshot_build_lock(snapshot_key):
+            # Outro worker pode ter gerado o snapshot enquanto aguardávamos a trava
+            df_users, df_interactions, snapshot_directory = load_snapshot(snapshot_key)
+            if df_users is None:
+                df_users, df_interactions = prepare_data(*load_source_data())
+                if save_snapshot(snapshot_key, df_users, df_interactions):
+                    # Reabrir a partir dos arquivos para compartilhar as páginas com os demais workers
+                    shared_users, shared_interactions, snapshot_directory = load_snapshot(snapshot_key)
+                    if shared_users is not None:
+                        df_users, df_interactions = shared_users, shared_interactions
+else:
+    df_users, df_interactions = prepare_data(*load_source_data())
+
+def user_ids(df):
+    """Identificadores na ordem dos user_code (user_code = posição neste índice)"""
+    if np.array_equal(df['user_code'].to_numpy(), np.arange(len(df))):
+        # Identificadores únicos e sem ausentes: a própria coluna, sem fatorar de novo
+        return pd.Index(df['unique_id'].array)
+    return pd.Index(pd.unique(df['unique_id'].dropna()))
+
+USER_IDS = user_ids(df_users)
+
+# Índice CSR por usuário: interações ordenadas por (user_code, numero_interacao), de modo que
+# as interações do usuário de código u ficam em USER_OFFSETS[u]:USER_OFFSETS[u + 1]
+INTERACTION_USER_CODES = (
+    df_interactions['user_code'].to_numpy() if 'user_code' in df_interactions.columns
+    else np.full(len(df_interactions), -1, dtype=np.int32)
+)
+
+USER_OFFSETS = derived('user_offsets', lambda: np.searchsorted(
+    INTERACTION_USER_CODES, np.arange(len(USER_IDS) + 1)).astype(np.int64))
+INTERACTION_NUMBERS = (
+    df_interactions['numero_interacao'].to_numpy() if 'numero_interacao' in df_interactions.columns else None
+)
+
+def user_interaction_rows(user_id, first_n=None):
+    """Fatia (sem cópia) das interações de um usuário; first_n mantém só as X primeiras"""
+    code = USER_IDS.get_indexer([user_id])[0]
+    if code < 0:
+        return df_interactions.iloc[0:0]
+    start, stop = USER_OFFSETS[code], USER_OFFSETS[code + 1]
+    if first_n:
+        # Interações já ordenadas por numero_interacao: o filtro vira um prefixo da fatia
+        if INTERACTION_NUMBERS is not None:
+            stop = start + np.searchsorted(INTERACTION_NUMBERS[start:stop], first_n, side='right')
+        else:
+            stop = min(stop, start + first_n)
+    return df_interactions.iloc[start:stop]
+
+# ======================================================================================
+# CUBO PRÉ-AGREGADO DE INTERAÇÕES
+# Contagens por (user_code, dispositivo, classificação de evento), calculadas uma vez no
+# carregamento: cada usuário ocupa no máximo (dispositivos × classificações) linhas do cubo,
+# e não uma por interação. O cubo responde às consultas sobre todas as interações carregadas
+# e às contagens dos filtros cruzados; a composição das "X primeiras interações" vem das somas
+# de prefixo, e as quebras por numero_interacao (ou as X primeiras com filtros cruzados)
+# percorrem só as interações selecionadas de cada usuário (índice CSR), localizadas por busca
+# binária nas chaves (usuário, numero_interacao), guardadas em int32 sempre que couberem.
+# "X primeiras interações" significa numero_interacao <= X em todos os gráficos.
+# ======================================================================================
+
+CUBE_DIMENSIONS = ['group', 'user_agent_device_type', 'event_classification', 'numero_interacao']
+
+def category_codes(df, col):
+    """Códigos de uma coluna categórica; valores ausentes recebem o código len(categorias)"""
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=np.int16), pd.Index([], dtype=object)
+    values = df[col].cat
+    codes = values.codes.to_numpy().astype(np.int16)
+    codes[codes < 0] = len(values.categories)
+    return codes, values.categories
+
+def interaction_numbers():
+    """numero_interacao de cada linha, ou a ordem dentro do usuário se a coluna não existir"""
+    if INTERACTION_NUMBERS is not None:
+        return INTERACTION_NUMBERS.astype(np.int64)
+    starts = USER_OFFSETS[np.clip(INTERACTION_USER_CODES, 0, None)]
+    return np.arange(len(INTERACTION_USER_CODES)) - starts + 1
+
+# Códigos de dispositivo e de classificação de evento de cada interação (ordem do índice CSR)
+INTERACTION_DEVICE_CODES, INTERACTION_EVENT_CODES = derived('interaction_codes', lambda: [
+    category_codes(df_interactions, col)[0] for col in ('user_agent_device_type', 'event_classification')])
+DEVICE_CATEGORIES = category_codes(df_interactions.iloc[:0], 'user_agent_device_type')[1]
+EVENT_CATEGORIES = category_codes(df_interactions.iloc[:0], 'event_classification')[1]
+
+# Interações de usuários conhecidos: user_code -1 ordena antes de todos no índice CSR
+KNOWN_INTERACTIONS = slice(int(USER_OFFSETS[0]), None)
+
+def build_interaction_cube():
+    """Agrega as interações de usuários conhecidos em linhas (usuário, dispositivo, evento) com contagem"""
+    shape = (len(USER_IDS), len(DEVICE_CATEGORIES) + 1, len(EVENT_CATEGORIES) + 1)
+    keys = np.ravel_multi_index((INTERACTION_USER_CODES[KNOWN_INTERACTIONS],
+                                 INTERACTION_DEVICE_CODES[KNOWN_INTERACTIONS],
+                                 INTERACTION_EVENT_CODES[KNOWN_INTERACTIONS]), shape)
+    keys, counts = np.unique(keys, return_counts=True)
+    user, device, event = np.unravel_index(keys, shape)
+    return {
+        'user': user.astype(np.int32),
+        'device': device.astype(np.int16),
+        'event': event.astype(np.int16),
+        'count': counts.astype(np.int32),
+    }
+
+INTERACTION_CUBE = derived('interaction_cube', build_interaction_cube)
+
+INTERACTION_KEY_STRIDE = FIRST_INTERACTIONS_MAX + 2
+
+def build_interaction_keys():
+    """Chave user_code × INTERACTION_KEY_STRIDE + numero_interacao de cada interação de usuário
+    conhecido (crescente, na ordem do índice CSR)"""
+    users = INTERACTION_USER_CODES[KNOWN_INTERACTIONS]
+    numbers = np.clip(interaction_numbers()[KNOWN_INTERACTIONS], 0, INTERACTION_KEY_STRIDE - 1)
+    keys = users.astype(np.int64) * INTERACTION_KEY_STRIDE + numbers
+    if len(USER_IDS) * INTERACTION_KEY_STRIDE <= np.iinfo(np.int32).max:
+        keys = keys.astype(np.int32)
+    return keys
+
+INTERACTION_KEYS = derived('interaction_keys', build_interaction_keys)
+
+# Maior numero_interacao carregado: limites de "X primeiras" acima dele não filtram nada
+MAX_INTERACTION_NUMBER = int((INTERACTION_KEYS % INTERACTION_KEY_STRIDE).max(initial=0))
+
+def first_interaction_rows(user_codes, first_n=None):
+    """Intervalos [início, fim) no índice CSR das interações com numero_interacao <= first_n de cada usuário"""
+    codes = np.asarray(user_codes, dtype=np.int64)
+    starts = USER_OFFSETS[codes]
+    if not first_n:
+        return starts, USER_OFFSETS[codes + 1]
+    limit = min(first_n, INTERACTION_KEY_STRIDE - 1)
+    # Interações conhecidas com chave <= (usuário, limite): todas as dos usuários anteriores mais
+    # as do próprio usuário até o limite
+    ends = np.searchsorted(INTERACTION_KEYS, codes * INTERACTION_KEY_STRIDE + limit, side='right') + USER_OFFSETS[0]
+    return starts, ends
+
+def concatenated_rows(starts, ends):
+    """Linhas dos intervalos [starts, ends) concatenados e o tamanho de cada intervalo"""
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(int(lengths.sum())), lengths
+
+def cross_filter_combinations(device_types=None, event_classes=None):
+    """Matriz (dispositivo × classificação de evento) das combinações aceitas pelos filtros
+    cruzados, indexada pelos códigos das interações (None = nenhum filtro ativo)"""
+    if not device_types and not event_classes:
+        return None
+    # A última posição de cada eixo (valor ausente) só passa quando aquele filtro está vazio
+    devices = (np.append(DEVICE_CATEGORIES.isin(device_types), False) if device_types
+               else np.ones(len(DEVICE_CATEGORIES) + 1, dtype=bool))
+    events = (np.append(EVENT_CATEGORIES.isin(event_classes), False) if event_classes
+              else np.ones(len(EVENT_CATEGORIES) + 1, dtype=bool))
+    return np.outer(devices, events)
+
+# ======================================================================================
+# SOMAS DE PREFIXO POR USUÁRIO
+# Para cada interação de usuário conhecido (na ordem do índice CSR), contagens acumuladas por
+# dispositivo e por classificação de evento desde a primeira interação do usuário. A composição
+# das "X primeiras interações" de todos os usuários vira uma única busca (searchsorted) e um
+# gather na última interação com numero_interacao <= X, sem varrer as interações a cada
+# movimento do slider. As tabelas usam int16 (int32 só se algum usuário passar de 32.767
+# interações), para não multiplicar a memória dos dados.
+# ======================================================================================
+
+def build_prefix_tables():
+    """Tabelas acumuladas por usuário, alinhadas às linhas de INTERACTION_KEYS"""
+    users = INTERACTION_USER_CODES[KNOWN_INTERACTIONS]
+    # Primeira linha do usuário de cada interação, relativa às interações conhecidas
+    starts = USER_OFFSETS[users] - USER_OFFSETS[0]
+    # Um acumulado nunca passa do total de interações do usuário
+    most = int(np.diff(USER_OFFSETS).max(initial=0))
+    dtype = np.int16 if most <= np.iinfo(np.int16).max else np.int32
+
+    tables = {}
+    for name, codes, categories in (
+            ('user_agent_device_type', INTERACTION_DEVICE_CODES, DEVICE_CATEGORIES),
+            ('event_classification', INTERACTION_EVENT_CODES, EVENT_CATEGORIES)):
+        codes = codes[KNOWN_INTERACTIONS]
+        table = np.empty((len(codes), len(categories) + 1), dtype=dtype)
+        for code in range(table.shape[1]):
+            # Acumulado global menos o acumulado antes da primeira linha do usuário
+            cumulative = np.r_[0, np.cumsum(codes == code)]
+            table[:, code] = cumulative[1:] - cumulative[starts]
+        tables[name] = table
+    return tables
+
+PREFIX_TABLES = derived('prefix_tables', build_prefix_tables)
+
+def first_interactions_composition(user_codes, column, first_n=None):
+    """Contagens (usuários × categorias de `column`) das interações com numero_interacao <= first_n"""
+    table = PREFIX_TABLES[column]
+    starts, ends = first_interaction_rows(user_codes, first_n)
+    found = ends > starts
+    composition = np.zeros((len(starts), table.shape[1]), dtype=np.int64)
+    # Acumulado na última interação selecionada de cada usuário
+    composition[found] = table[ends[found] - 1 - USER_OFFSETS[0]]
+    return composition
+
+# ======================================================================================
+# ÍNDICE DE BITMAPS DOS FILTROS CRUZADOS
+# Um bitmap compactado (np.packbits) por tipo de dispositivo e por classificação de evento,
+# marcando as linhas do cubo de cada opção. Uma seleção de filtros cruzados vira OR dos bitmaps
+# dentro de cada filtro e AND entre os dois filtros; as mesmas operações dão as contagens
+# exibidas ao lado de cada opção em cross_filter_controls.
+# ======================================================================================
+
+CROSS_FILTER_DIMENSIONS = {
+    'user_agent_device_type': ('device', DEVICE_CATEGORIES),
+    'event_classification': ('event', EVENT_CATEGORIES),
+}
+
+def build_filter_bitmaps(cube):
+    """{coluna: {opção: bitmap compactado das linhas do cubo com essa opção}}"""
+    return {
+        name: {category: np.packbits(cube[col] == code) for code, category in enumerate(categories)}
+        for name, (col, categories) in CROSS_FILTER_DIMENSIONS.items()
+    }
+
+CROSS_FILTER_BITMAPS = derived('filter_bitmaps', lambda: build_filter_bitmaps(INTERACTION_CUBE))
+
+def cross_filter_bitmap(device_types=None, event_classes=None):
+    """Bitmap das linhas do cubo aceitas pelos filtros cruzados (None = nenhum filtro ativo)"""
+    combined = None
+    for name, selected in (('user_agent_device_type', device_types), ('event_classification', event_classes)):
+        if not selected:
+            continue
+        selection = np.zeros((len(INTERACTION_CUBE['count']) + 7) // 8, dtype=np.uint8)
+        for option in selected:
+            if option in CROSS_FILTER_BITMAPS[name]:
+                selection |= CROSS_FILTER_BITMAPS[name][option]
+        combined = selection if combined is None else combined & selection
+    return combined
+
+def bitmap_rows(bitmap):
+    """Máscara booleana das linhas do cubo marcadas no bitmap"""
+    return np.unpackbits(bitmap, count=len(INTERACTION_CUBE['count'])).view(bool)
+
+def cross_filter_facets(device_types=None, event_classes=None):
+    """Interações por opção de cada filtro cruzado, respeitando a seleção do outro filtro"""
+    others = {
+        'user_agent_device_type': cross_filter_bitmap(event_classes=event_classes),
+        'event_classification': cross_filter_bitmap(device_types=device_types),
+    }
+    facets = {}
+    for name, other in others.items():
+        facets[name] = {}
+        for option, bitmap in CROSS_FILTER_BITMAPS[name].items():
+            if other is not None:
+                bitmap = bitmap & other
+            facets[name][option] = int(INTERACTION_CUBE['count'][bitmap_rows(bitmap)].sum())
+    return facets
+
+def facet_choices(options, counts):
+    """Rótulos das opções de filtro com a contagem de interações entre parênteses"""
+    return {option: f"{option} ({counts.get(option, 0):,})" for option in options}
+
+def aggregate_interactions(user_codes, by, first_n=None, device_types=None, event_classes=None, groups=None):
+    """Soma as interações dos usuários informados agrupando pelas colunas de `by` (subconjunto de
+    CUBE_DIMENSIONS), como groupby(by).size() sobre as interações filtradas. `groups` é a Series
+    categórica de grupos alinhada a user_codes, obrigatória quando 'group' está em `by`.
+    As X primeiras interações (first_n) são as de numero_interacao <= X de cada usuário, em todos
+    os gráficos: os filtros cruzados escolhem, dentre elas, as dos dispositivos/eventos
+    selecionados (e não as X primeiras entre as interações que passam nos filtros)."""
+    cube = INTERACTION_CUBE
+
+    # Código do grupo de cada user_code (-1 = fora da coorte). Usuários sem identificador
+    # (user_code -1) não têm interações associadas e não podem indexar member
+    member = np.full(len(USER_IDS), -1, dtype=np.int16)
+    codes = np.asarray(user_codes)
+    known = codes >= 0
+    codes = codes[known]
+    if groups is not None:
+        member[codes] = groups.cat.codes.to_numpy()[known]
+        group_labels = groups.cat.categories
+    else:
+        member[codes] = 0
+        group_labels = pd.Index([0])
+    if first_n and first_n >= MAX_INTERACTION_NUMBER:
+        first_n = None
+
+    # Sem filtros cruzados e sem numero_interacao no agrupamento: composição das X primeiras
+    # interações direto das somas de prefixo, sem percorrer o cubo
+    composition_columns = [name for name in by if name != 'group']
+    if (not device_types and not event_classes and len(composition_columns) == 1
+            and composition_columns[0] in PREFIX_TABLES):
+        column = composition_columns[0]
+        composition = first_interactions_composition(codes, column, first_n)
+        dimensions = {
+            'group': (np.repeat(member[codes], composition.shape[1]), group_labels),
+            column: (np.tile(np.arange(composition.shape[1]), len(codes)),
+                     DEVICE_CATEGORIES if column == 'user_agent_device_type' else EVENT_CATEGORIES),
+        }
+        return interaction_count_series(dimensions, by, composition.ravel())
+
+    if first_n or 'numero_interacao' in by:
+        # Quebra por numero_interacao ou X primeiras com filtros cruzados: percorrer apenas as
+        # interações selecionadas de cada usuário da coorte, via índice CSR
+        starts, ends = first_interaction_rows(codes, first_n)
+        rows, lengths = concatenated_rows(starts, ends)
+        user_groups = np.repeat(member[codes], lengths)
+        accepted = cross_filter_combinations(device_types, event_classes)
+        if accepted is not None:
+            keep = accepted[INTERACTION_DEVICE_CODES[rows], INTERACTION_EVENT_CODES[rows]]
+            rows, user_groups = rows[keep], user_groups[keep]
+        dimensions = {
+            'group': (user_groups, group_labels),
+            'user_agent_device_type': (INTERACTION_DEVICE_CODES[rows], DEVICE_CATEGORIES),
+            'event_classification': (INTERACTION_EVENT_CODES[rows], EVENT_CATEGORIES),
+            'numero_interacao': (INTERACTION_KEYS[rows - USER_OFFSETS[0]] % INTERACTION_KEY_STRIDE,
+                                 pd.RangeIndex(INTERACTION_KEY_STRIDE)),
+        }
+        return interaction_count_series(dimensions, by, np.ones(len(rows), dtype=np.int64))
+
+    rows = member[cube['user']] >= 0
+    bitmap = cross_filter_bitmap(device_types, event_classes)
+    if bitmap is not None:
+        rows &= bitmap_rows(bitmap)
+    rows = np.flatnonzero(rows)
+
+    dimensions = {
+        'group': (member[cube['user'][rows]], group_labels),
+        'user_agent_device_type': (cube['device'][rows], DEVICE_CATEGORIES),
+        'event_classification': (cube['event'][rows], EVENT_CATEGORIES),
+    }
+    return interaction_count_series(dimensions, by, cube['count'][rows])
+
+def interaction_count_series(dimensions, by, weights):
+    """Soma `weights` por combinação das dimensões de `by` ({nome: (códigos, categorias)})"""
+    dim_codes = [dimensions[name][0] for name in by]
+    levels = [dimensions[name][1] for name in by]
+    shape = tuple(len(level) for level in levels)
+
+    # Linhas com dispositivo/evento ausente não entram no agrupamento (como no groupby)
+    valid = np.logical_and.reduce([c < len(level) for c, level in zip(dim_codes, levels)])
+    keys = np.ravel_multi_index([c[valid] for c in dim_codes], shape)
+    totals = np.bincount(keys, weights=weights[valid], minlength=int(np.prod(shape)))
+
+    present = np.flatnonzero(totals)
+    index = pd.MultiIndex(levels=levels, codes=np.unravel_index(present, shape), names=by)
+    if len(by) == 1:
+        index = index.get_level_values(0)
+    return pd.Series(totals[present].astype(np.int64), index=index, name='interaction_count')
+
+# ======================================================================================
+# CACHE DE RESULTADOS ENTRE SESSÕES
+# LRU do processo, limitado em bytes, com os dados agregados dos gráficos (nunca figuras).
+# A chave é um hash canônico do estado dos filtros e da chave do snapshot de dados, de modo
+# que sessões com os mesmos parâmetros reaproveitam o resultado e um novo snapshot nunca
+# reutiliza agregados antigos. As agregações rodam nas threads do PLOT_EXECUTOR, e cálculos
+# idênticos simultâneos são coalescidos (single-flight): quem chega enquanto o primeiro ainda
+# calcula aguarda o mesmo Future em vez de repetir o trabalho.
+# ======================================================================================
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('APRENDIZAP_RESULT_CACHE_MB', '64')) * 1024 * 1024
+
+def byte_lru(max_bytes):
+    """LRU limitado em bytes, compartilhado entre threads (entradas, total, lock e cálculos em andamento)"""
+    return {'entries': OrderedDict(), 'bytes': 0, 'max_bytes': max_bytes,
+            'lock': threading.Lock(), 'inflight': {}}
+
+def lru_get(cache, key):
+    """Valor em cache para key (None se ausente); chamar com cache['lock'] adquirido"""
+    entry = cache['entries'].get(key)
+    if entry is None:
+        return None
+    cache['entries'].move_to_end(key)
+    return entry[0]
+
+def lru_put(cache, key, value, size):
+    """Armazena value e descarta os menos usados até caber; chamar com cache['lock'] adquirido"""
+    if size > cache['max_bytes'] or key in cache['entries']:
+        return
+    cache['entries'][key] = (value, size)
+    cache['bytes'] += size
+    while cache['bytes'] > cache['max_bytes']:
+        _, (_, evicted) = cache['entries'].popitem(last=False)
+        cache['bytes'] -= evicted
+
+RESULT_CACHE = byte_lru(RESULT_CACHE_MAX_BYTES)
+
+def result_nbytes(value):
+    """Memória aproximada de um resultado agregado"""
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(result_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(result_nbytes(item) for item in value.values())
+    return 64
+
+def result_cache_key(name, params):
+    """Hash canônico (ordem das chaves e das seleções não importa) dos parâmetros de um resultado"""
+    canonical = json.dumps({'data': snapshot_key, 'name': name, 'params': params},
+                           sort_keys=True, default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+def cached_result(name, params, compute):
+    """Retorna o resultado em cache para (name, params) ou calcula com compute() e armazena"""
+    key = result_cache_key(name, params)
+    cache = RESULT_CACHE
+    with cache['lock']:
+        value = lru_get(cache, key)
+        if value is not None:
+            return value
+        # Mesmo cálculo já em andamento (em outra thread): aguardar o resultado dele
+        future = cache['inflight'].get(key)
+        if future is None:
+            future = cache['inflight'][key] = Future()
+            leader = True
+        else:
+            leader = False
+    if not leader:
+        return future.result()
+
+    try:
+        value = compute()
+    except BaseException as e:
+        with cache['lock']:
+            del cache['inflight'][key]
+        future.set_exception(e)
+        raise
+
+    size = result_nbytes(value)
+    with cache['lock']:
+        del cache['inflight'][key]
+        lru_put(cache, key, value, size)
+    future.set_result(value)
+    return value
 
 TOTAL_USERS = len(df_users)
 
@@ -108,6 +905,78 @@ def calculate_slider_limits():
 # Calcular os limites
 SLIDER_LIMITS = calculate_slider_limits()
 
+# ======================================================================================
+# ÍNDICE DE CONTAGEM RUP
+# Responde "quantos usuários têm as cinco variáveis RUP >= limiares" sem montar a máscara
+# de df_users. Os valores de cada variável são comprimidos para seu posto entre os valores
+# distintos. Quando o cubo de somas sufixas (uma célula por combinação de postos, com a
+# contagem de usuários com postos >= aos da célula) não ocupa mais que o próprio índice
+# compactado, a consulta é uma leitura do cubo. Com amplitudes realistas o cubo cresce com
+# o produto das amplitudes e passa do tamanho dos dados: usa-se então a variante compacta,
+# em que os cinco postos de cada usuário ficam num único inteiro, cada campo com um bit de
+# guarda acima dele. Subtrair os limiares empacotados da mesma forma preserva o bit de guarda
+# de um campo exatamente quando posto >= limiar (o empréstimo não atravessa o guarda), de
+# modo que a contagem é uma única passada vetorizada de subtração, AND e comparação.
+# ======================================================================================
+
+def suffix_sum_cube(ranks, shape):
+    """Cubo em que cada célula conta os usuários com todos os postos >= aos da célula"""
+    flat = np.ravel_multi_index(ranks, shape) if ranks[0].size else np.empty(0, dtype=np.int64)
+    cube = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+    for axis in range(len(shape)):
+        cube = np.flip(np.cumsum(np.flip(cube, axis), axis=axis), axis)
+    return cube.astype(np.int32)
+
+def build_rup_count_index(df):
+    """Pré-calcula o índice de contagem RUP (None se faltar alguma variável ou se os postos
+    não couberem em 64 bits)"""
+    if not all(col in df.columns for col in RUP_COLUMNS):
+        return None
+
+    values = [df[col].to_numpy() for col in RUP_COLUMNS]
+    # Valores ausentes nunca satisfazem ">=": ficam fora do índice
+    valid = np.logical_and.reduce([~pd.isna(v) for v in values])
+    values = [v[valid] for v in values]
+    axes = [np.unique(v) for v in values]
+    ranks = [np.searchsorted(axis, v).astype(np.int64) for axis, v in zip(axes, values)]
+
+    # Cada campo comporta postos de 0 a len(axis) (limiar acima do maior valor) e tem um bit de guarda
+    bits = [len(axis).bit_length() for axis in axes]
+    shifts = np.cumsum([0] + [b + 1 for b in bits[:-1]]).tolist()
+    total_bits = shifts[-1] + bits[-1] + 1
+    if total_bits > 64:
+        return None
+    dtype = np.uint32 if total_bits <= 32 else np.uint64
+
+    # Posição extra no fim de cada eixo: limiar acima do maior valor (contagem zero)
+    shape = tuple(len(axis) + 1 for axis in axes)
+    if np.prod(shape, dtype=np.float64) * 4 <= len(ranks[0]) * np.dtype(dtype).itemsize:
+        return {'axes': axes, 'cube': suffix_sum_cube(ranks, shape)}
+
+    packed = np.zeros(len(ranks[0]), dtype=dtype)
+    for rank, shift in zip(ranks, shifts):
+        packed |= rank.astype(dtype) << dtype(shift)
+    guards = sum(1 << (shift + b) for shift, b in zip(shifts, bits))
+    return {'axes': axes, 'packed': packed | dtype(guards), 'shifts': shifts, 'guards': guards}
+
+def rup_user_count(index, thresholds):
+    """Número de usuários com as variáveis RUP >= thresholds (na ordem de RUP_COLUMNS)"""
+    cells = [int(np.searchsorted(axis, t, side='left')) for axis, t in zip(index['axes'], thresholds)]
+    if 'cube' in index:
+        return int(index['cube'][tuple(cells)])
+
+    packed = index['packed']
+    guards = packed.dtype.type(index['guards'])
+    limits = packed.dtype.type(sum(cell << shift for cell, shift in zip(cells, index['shifts'])))
+    return int(np.count_nonzero(((packed - limits) & guards) == guards))
+
+# Colunas de df_users como arrays NumPy somente leitura, usados nas máscaras da coorte
+RUP_VALUES = {col: df_users[col].to_numpy() for col in RUP_COLUMNS if col in df_users.columns}
+FIRST_SEEN_DAY = df_users['first_seen_day'].to_numpy()
+FIRST_SEEN_MONTH = df_users['first_seen_month'].to_numpy()
+
+RUP_COUNT_INDEX = derived('rup_count_index', lambda: build_rup_count_index(df_users))
+
 # Variáveis disponíveis para segmentação
 SEGMENTATION_VARIABLES = {
     'sessions_days': 'Sessões (dias distintos)',
@@ -144,8 +1013,8 @@ def generate_threshold_inputs(num_groups, var_name):
     
     # Tratar datas de forma especial
     if var_name == 'first_seen':
-        # Converter para datetime e obter min/max
-        dates = pd.to_datetime(df_users[var_name]).dt.tz_localize(None)
+        # Datas já normalizadas no carregamento: obter min/max
+        dates = df_users[var_name]
         min_val = dates.min().date()
         max_val = dates.max().date()
         
@@ -268,25 +1137,297 @@ def generate_favicon_sizes():
         '32x32': f"data:image/svg+xml;base64,{base64.b64encode(favicon_32.encode()).decode()}#{timestamp}"
     }
 
-# Função para configurar a fonte Montserrat
-def setup_montserrat_font():
-    """Configura a fonte Montserrat para matplotlib com fallback robusto"""
+# ======================================================================================
+# ESTILO DOS GRÁFICOS
+# O estilo (padrão do matplotlib com fontes sans-serif) é montado uma única vez, na
+# importação, antes de o servidor criar as threads e os processos de rasterização. Depois
+# disso os rcParams não são mais alterados: cada figura lê o mesmo estado imutável, o que
+# é seguro entre threads e dispensa reconfigurar o estilo a cada gráfico.
+# ======================================================================================
+
+PLOT_STYLE = MappingProxyType({
+    # Usar apenas fontes que estão garantidamente disponíveis no Windows
+    'font.family': 'sans-serif',
+    'font.sans-serif': ('Arial', 'DejaVu Sans', 'sans-serif'),
+    # SVG com texto como texto (bem menor que o texto convertido em curvas)
+    'svg.fonttype': 'none',
+})
+
+def apply_plot_style():
+    """Aplica PLOT_STYLE sobre o estilo padrão do matplotlib (chamada única, na importação)"""
+    plt.style.use(['default', dict(PLOT_STYLE)])
+    # Remover avisos de fonte
+    warnings.filterwarnings('ignore', category=UserWarning, module='matplotlib.font_manager')
+    warnings.filterwarnings('ignore', message='findfont: Font family.*not found')
+
+apply_plot_style()
+
+# ======================================================================================
+# RASTERIZAÇÃO FORA DO LOOP DE EVENTOS
+# As figuras são criadas pela API orientada a objetos (sem o estado global do pyplot), o que
+# permite montá-las e rasterizá-las em threads do PLOT_EXECUTOR enquanto o loop atende outras
+# sessões (as funções de gráfico leem as entradas no loop e continuam na thread).
+# Cada thread serializa a figura e a desenha num processo do PLOT_PROCESS_POOL, de modo que
+# as saídas de um mesmo clique são rasterizadas em paralelo (sem disputar o GIL) e chegam ao
+# navegador à medida que ficam prontas. Os processos nascem de um forkserver (spawn onde não
+# houver) que importa apenas o módulo leve plot_worker, sem herdar nada do servidor web e das
+# suas threads. O pool é criado no primeiro desenho (nunca na importação, que também roda no
+# build da imagem) e recriado se um processo morrer; enquanto isso, ou com
+# APRENDIZAP_PLOT_PROCESSES=0, o desenho acontece na própria thread. Toda figura montada
+# passa pela rasterização (ou é descartada por ela) e é liberada logo em seguida;
+# FIGURES_IN_USE conta as montadas e ainda não liberadas (deve voltar a zero quando não há
+# desenho em andamento).
+# A imagem final de cada saída fica num LRU limitado em bytes (FIGURE_CACHE), endereçado pelo
+# hash do estado que determina a figura (filtros, opções de exibição, estilo, formato e
+# tamanho em pixels): um acerto é enviado sem montar nem desenhar a figura. A figura
+# serializada também fica no cache, para redesenhar a saída em outro tamanho sem executar a
+# função do gráfico.
+# A resolução acompanha a saída: em saídas estreitas (celulares) o DPI diminui com a largura,
+# e a densidade de pixels é limitada (plot_worker.PLOT_MAX_PIXELRATIO). O formato é PNG por
+# padrão, ou WebP sem perdas / PNG com paleta (APRENDIZAP_PLOT_FORMAT); os gráficos de barras
+# simples de SVG_PLOTS são enviados como SVG, que não depende da resolução.
+# ======================================================================================
+
+PLOT_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('APRENDIZAP_PLOT_THREADS', '2')), thread_name_prefix='plot')
+
+PLOT_PROCESSES = int(os.environ.get('APRENDIZAP_PLOT_PROCESSES', '2'))
+
+# Pool atual (None até o primeiro desenho ou depois de quebrar)
+PLOT_PROCESS_POOL = None
+PLOT_POOL_LOCK = threading.Lock()
+
+def plot_process_context():
+    """Contexto dos processos de rasterização: forkserver (que importa só o plot_worker) ou
+    spawn onde não houver; nunca fork do servidor, que já tem threads em andamento"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['plot_worker'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def plot_process_pool():
+    """Pool de processos de rasterização, criado no primeiro uso; os processos iniciam no primeiro
+    submit, numa thread do PLOT_EXECUTOR. None se desativado (APRENDIZAP_PLOT_PROCESSES=0)"""
+    global PLOT_PROCESS_POOL
+    if PLOT_PROCESSES <= 0:
+        return None
+    with PLOT_POOL_LOCK:
+        if PLOT_PROCESS_POOL is None:
+            PLOT_PROCESS_POOL = ProcessPoolExecutor(
+                max_workers=PLOT_PROCESSES, mp_context=plot_process_context(),
+                initializer=plot_worker.init_worker, initargs=(dict(PLOT_STYLE),))
+        return PLOT_PROCESS_POOL
+
+def discard_plot_process_pool(pool):
+    """Descarta um pool quebrado (processo morto); o próximo desenho cria outro"""
+    global PLOT_PROCESS_POOL
+    with PLOT_POOL_LOCK:
+        if PLOT_PROCESS_POOL is pool:
+            PLOT_PROCESS_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+# 'png', 'webp' (sem perdas) ou 'png8' (paleta de 256 cores, otimizado)
+PLOT_FORMAT = os.environ.get('APRENDIZAP_PLOT_FORMAT', 'png')
+
+SVG_PLOTS = ({'rup_distribution_plot', 'segmentation_bar_plot'}
+             if os.environ.get('APRENDIZAP_PLOT_SVG', '1') == '1' else set())
+
+FIGURE_KWARGS = {'figsize', 'dpi', 'facecolor', 'edgecolor', 'layout'}
+
+# Figuras montadas por figure_subplots e ainda não liberadas, para monitoramento. As referências
+# são fracas: uma figura descartada sem passar por release_figure (ex.: por um except que devolve
+# o estado vazio) é coletada normalmente e sai da contagem
+FIGURES_IN_USE = weakref.WeakSet()
+FIGURES_IN_USE_LOCK = threading.Lock()
+
+def figure_subplots(nrows=1, ncols=1, **kwargs):
+    """Equivalente a plt.subplots, mas a figura não é registrada no pyplot"""
+    fig = Figure(**{key: value for key, value in kwargs.items() if key in FIGURE_KWARGS})
+    with FIGURES_IN_USE_LOCK:
+        FIGURES_IN_USE.add(fig)
+    axes = fig.subplots(nrows, ncols, **{key: value for key, value in kwargs.items() if key not in FIGURE_KWARGS})
+    return fig, axes
+
+def release_figure(fig):
+    """Libera os artistas da figura depois da rasterização (a figura não é mais usada).
+    Liberar de novo a mesma figura (ou uma cópia vinda de outro processo) não altera a contagem"""
+    if not isinstance(fig, Figure):
+        return
+    with FIGURES_IN_USE_LOCK:
+        FIGURES_IN_USE.discard(fig)
+    fig.clear()
+
+def figures_in_use():
+    """Número de figuras montadas, ainda vivas e não liberadas no processo"""
+    with FIGURES_IN_USE_LOCK:
+        return len(FIGURES_IN_USE)
+
+def plot_format(name):
+    """Formato da imagem de uma saída"""
+    return 'svg' if name in SVG_PLOTS else PLOT_FORMAT
+
+def resume_figure(figure):
+    """Conclui uma função de gráfico pausada no yield (depois das leituras reativas) e retorna o
+    seu resultado: a figura ou uma imagem pronta (estado vazio ou erro)"""
     try:
-        # Usar apenas fontes que estão garantidamente disponíveis no Windows
-        plt.rcParams['font.family'] = 'sans-serif'
-        plt.rcParams['font.sans-serif'] = ['Arial', 'DejaVu Sans', 'sans-serif']
-        
-        # Remover avisos de fonte
-        import warnings
-        warnings.filterwarnings('ignore', category=UserWarning, module='matplotlib.font_manager')
-        warnings.filterwarnings('ignore', message='findfont: Font family.*not found')
-        
-        return False  # Sempre retorna False pois não usamos Montserrat
-    except Exception as e:
-        print(f"Erro ao configurar fonte: {e}")
-        # Fallback para fonte padrão
-        plt.rcParams['font.family'] = 'sans-serif'
-        return False
+        next(figure)
+    except StopIteration as stop:
+        return stop.value
+    figure.close()
+    raise RuntimeError("Função de gráfico com mais de um yield")
+
+class PickledFigure:
+    """Figura já montada e serializada com pickle (guardada no FIGURE_CACHE), para redesenhar
+    a saída em outro tamanho sem executar de novo a função do gráfico"""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+def draw_figure(data, width, height, pixelratio, fmt, fig=None):
+    """Desenha a figura serializada num processo do PLOT_PROCESS_POOL; sem o pool, desenha na
+    própria thread (a figura original fig, quando disponível)"""
+    pool = plot_process_pool()
+    if pool is not None:
+        try:
+            return pool.submit(plot_worker.pickled_figure_bytes, data, width, height, pixelratio, fmt).result()
+        except BrokenProcessPool as e:
+            discard_plot_process_pool(pool)
+            logger.warning("Processo de rasterização encerrado, desenhando na thread e recriando o pool: %s", e)
+        except Exception as e:
+            logger.warning("Rasterização em processo indisponível, desenhando na thread: %s", e)
+    if fig is None:
+        return plot_worker.pickled_figure_bytes(data, width, height, pixelratio, fmt)
+    return plot_worker.figure_bytes(fig, width, height, pixelratio, fmt)
+
+def figure_bytes_if_current(is_current, figure, width, height, pixelratio, fmt, source_key):
+    """Monta a figura (se ainda pausada), guarda-a serializada em source_key e a desenha, exceto
+    quando o pedido já foi superado ao chegar a vez na fila ou ao terminar a montagem (retorna None)"""
+    if not is_current():
+        return None
+    if isinstance(figure, PickledFigure):
+        return draw_figure(figure.data, width, height, pixelratio, fmt)
+    fig = resume_figure(figure) if isinstance(figure, GeneratorType) else figure
+    if isinstance(fig, bytes):
+        return fig
+    if not is_current():
+        release_figure(fig)
+        return None
+    try:
+        data = pickle.dumps(fig)
+        if source_key is not None:
+            store_figure(source_key, data)
+        return draw_figure(data, width, height, pixelratio, fmt, fig)
+    finally:
+        release_figure(fig)
+
+FIGURE_CACHE = byte_lru(int(os.environ.get('APRENDIZAP_FIGURE_CACHE_MB', '32')) * 1024 * 1024)
+
+# Estilo comum a todas as figuras: entra na chave do FIGURE_CACHE
+FIGURE_STYLE = {'colors': GLOBAL_COLORS, 'rc': dict(PLOT_STYLE), 'matplotlib': matplotlib.__version__}
+
+def figure_cache_key(name, state, width, height, pixelratio):
+    """Chave da imagem de uma saída: estado que determina a figura, estilo, formato e tamanho em pixels"""
+    return result_cache_key('figure', {'output': name, 'state': state, 'style': FIGURE_STYLE,
+                                       'format': plot_format(name), 'size': [width, height, pixelratio]})
+
+def figure_source_key(name, state):
+    """Chave da figura serializada de uma saída (independente do tamanho e do formato)"""
+    return result_cache_key('figure_source', {'output': name, 'state': state, 'style': FIGURE_STYLE})
+
+def cached_figure(key):
+    """Imagem (ou figura serializada) em cache para a chave (None se ausente)"""
+    with FIGURE_CACHE['lock']:
+        return lru_get(FIGURE_CACHE, key)
+
+def store_figure(key, image):
+    """Armazena a imagem (ou a figura serializada) de uma saída no FIGURE_CACHE"""
+    with FIGURE_CACHE['lock']:
+        lru_put(FIGURE_CACHE, key, image, len(image))
+
+def image_mime(data):
+    """Tipo MIME de uma imagem codificada (PNG, WebP ou SVG)"""
+    if data.startswith(b'RIFF'):
+        return 'image/webp'
+    if data.startswith(b'<?xml') or data.startswith(b'<svg'):
+        return 'image/svg+xml'
+    return 'image/png'
+
+class render_figure(Renderer[bytes]):
+    """Como o render.plot, mas a função retorna a imagem já codificada (ocupa todo o contêiner)"""
+
+    async def transform(self, value):
+        return {'src': f"data:{image_mime(value)};base64," + base64.b64encode(value).decode(),
+                'width': '100%', 'height': '100%'}
+
+# ======================================================================================
+# IMAGENS DE ESTADO VAZIO
+# Avisos como "Clique em 'Calcular Gráficos'" ou "Nenhum usuário RUP encontrado" não usam o
+# matplotlib: são SVGs com título e mensagem centralizados, dimensionados pelo navegador, de
+# modo que uma única imagem por (título, mensagem) serve qualquer tamanho de saída. O primeiro
+# carregamento da página não rasteriza nenhuma figura.
+# ======================================================================================
+
+EMPTY_STATE_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="100%" height="100%" '
+    'font-family="Arial, DejaVu Sans, sans-serif" text-anchor="middle">'
+    '<rect width="100%" height="100%" fill="#ffffff"/>'
+    '<rect x="4%" y="14%" width="92%" height="80%" fill="none" stroke="#000000" stroke-width="0.8"/>'
+    '<text x="50%" y="8%" dominant-baseline="middle" font-size="{title_px}" font-weight="bold">{title}</text>'
+    '<text x="50%" y="54%" dominant-baseline="middle" font-size="14">{message}</text>'
+    '</svg>'
+)
+
+@functools.lru_cache(maxsize=256)
+def empty_state_image(title, message, fontsize=14):
+    """SVG de estado vazio de um gráfico (título com fontsize em pontos, como no matplotlib)"""
+    return EMPTY_STATE_SVG.format(title=html.escape(title), message=html.escape(message),
+                                  title_px=round(fontsize * 100 / 72)).encode()
+
+# ======================================================================================
+# GRÁFICOS NO NAVEGADOR
+# Modo alternativo (APRENDIZAP_CHART_MODE=client): os gráficos de CLIENT_CHARTS não são
+# rasterizados no servidor. A saída envia apenas os agregados (rótulos, séries, cores) e o
+# charts.js, sem dependências externas, desenha num <canvas>; redimensionar ou reconectar
+# não custa CPU do servidor. Os demais gráficos continuam como imagem.
+# ======================================================================================
+
+CHART_MODE = os.environ.get('APRENDIZAP_CHART_MODE', 'server')
+
+CLIENT_CHARTS = {'rup_distribution_plot', 'temporal_plot', 'segmentation_bar_plot', 'device_interactions_plot'}
+
+class render_chart(Renderer[dict]):
+    """Envia ao navegador a especificação de um gráfico (agregados já em tipos JSON)"""
+
+    async def transform(self, value):
+        return value
+
+def output_chart(id):
+    """Saída de gráfico: desenhada no navegador (CLIENT_CHARTS no modo 'client') ou imagem"""
+    if CHART_MODE == 'client' and id in CLIENT_CHARTS:
+        return ui.div(id=id, class_="aprendizap-chart", style="width: 100%; height: 400px;")
+    return ui.output_plot(id)
+
+# Posições dos rótulos do eixo x de um gráfico temporal
+def temporal_tick_positions(date_strings):
+    """
+    Se o período for maior que 12 meses, retorna apenas as posições de janeiro (mês 1) e
+    julho (mês 7); caso contrário, todas. Rótulos fora do formato 'AAAA-MM' são mantidos.
+    """
+    if len(set(date_strings)) <= 12:
+        return list(range(len(date_strings)))
+    positions = []
+    for i, date_str in enumerate(date_strings):
+        # Extrair ano e mês
+        try:
+            year, month = date_str.split('-')
+            if int(month) in [1, 7]:
+                positions.append(i)
+        except:
+            # Se não conseguir extrair ano/mês, incluir todos
+            positions.append(i)
+    return positions
 
 # Função para configurar rótulos do eixo x baseado no período temporal
 def configure_temporal_x_labels(ax, date_index, rotation=0):
@@ -307,36 +1448,9 @@ def configure_temporal_x_labels(ax, date_index, rotation=0):
         else:
             date_strings = [str(d) for d in date_index]
         
-        # Calcular o número de meses únicos
-        unique_months = len(set(date_strings))
-        
-        if unique_months > 12:
-            # Período maior que 1 ano: mostrar apenas janeiro e julho
-            filtered_labels = []
-            filtered_positions = []
-            
-            for i, date_str in enumerate(date_strings):
-                # Extrair ano e mês
-                try:
-                    year, month = date_str.split('-')
-                    month_int = int(month)
-                    
-                    # Mostrar apenas mês 1 (janeiro) ou 7 (julho)
-                    if month_int in [1, 7]:
-                        filtered_labels.append(date_str)
-                        filtered_positions.append(i)
-                except:
-                    # Se não conseguir extrair ano/mês, incluir todos
-                    filtered_labels.append(date_str)
-                    filtered_positions.append(i)
-            
-            # Configurar eixo x
-            ax.set_xticks(filtered_positions)
-            ax.set_xticklabels(filtered_labels, rotation=rotation)
-        else:
-            # Período menor ou igual a 1 ano: mostrar todos os meses
-            ax.set_xticks(range(len(date_strings)))
-            ax.set_xticklabels(date_strings, rotation=rotation)
+        positions = temporal_tick_positions(date_strings)
+        ax.set_xticks(positions)
+        ax.set_xticklabels([date_strings[i] for i in positions], rotation=rotation)
             
     except Exception as e:
         print(f"Erro ao configurar rótulos temporais: {e}")
@@ -354,6 +1468,18 @@ def load_css():
         print("Arquivo styles.css não encontrado. Usando estilos padrão.")
         return ""
 
+# Função para carregar o JavaScript dos gráficos desenhados no navegador
+def load_chart_js():
+    """Carrega o arquivo charts.js (apenas no modo de gráficos no navegador)"""
+    if CHART_MODE != 'client':
+        return ""
+    try:
+        with open('charts.js', 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        logger.warning("Arquivo charts.js não encontrado. Os gráficos no navegador não serão exibidos.")
+        return ""
+
 
 # ======================================================================================
 # 2. A INTERFACE DO USUÁRIO (UI)
@@ -362,6 +1488,7 @@ def load_css():
 app_ui = ui.page_fluid(
     ui.tags.head(
         ui.tags.style(load_css()),
+        ui.tags.script(load_chart_js()),
         ui.tags.title("AprendiZAP - Simulador RUP"),
         # Múltiplos tamanhos de favicon para melhor compatibilidade
         ui.tags.link(rel="icon", type="image/svg+xml", sizes="any", href=load_favicon()),
@@ -439,8 +1566,8 @@ app_ui = ui.page_fluid(
                 ui.input_checkbox("show_rup_only", "Mostrar apenas usuários RUP", value=False),
                 ui.input_checkbox("show_post_mari", "Mostrar apenas dados após Mari IA (ago/2024)", value=False),
                 ui.input_date_range("date_range", "Filtrar por período", 
-                                  start=pd.to_datetime(df_users['first_seen']).min().date() if 'first_seen' in df_users.columns else None,
-                                  end=pd.to_datetime(df_users['first_seen']).max().date() if 'first_seen' in df_users.columns else None),
+                                  start=df_users['first_seen'].min().date() if 'first_seen' in df_users.columns else None,
+                                  end=df_users['first_seen'].max().date() if 'first_seen' in df_users.columns else None),
                 ui.hr(style="border-color: rgba(255,255,255,0.3); margin: 20px 0;"),
                 ui.h4("Filtros Cruzados"),
                 ui.input_checkbox("enable_cross_filters", "Habilitar filtros cruzados", value=True),
@@ -469,7 +1596,7 @@ app_ui = ui.page_fluid(
                 # Filtro de primeiras interações
                 ui.h4("Filtro de Interações", style="margin-top: 20px;"),
                 ui.input_slider("first_interactions", "Analisar X primeiras interações", 
-                               min=1, max=100, value=10, step=1,
+                               min=1, max=FIRST_INTERACTIONS_MAX, value=10, step=1,
                                ticks=False),
                 
                 # Opções de visualização
@@ -490,12 +1617,12 @@ app_ui = ui.page_fluid(
                 ui.div(
                     ui.div(
                         ui.h4("Distribuição de Usuários", style="text-align: center; color: #8A2BE2; margin-bottom: 15px;"),
-        ui.output_plot("rup_distribution_plot"), # Gráfico de distribuição
+        output_chart("rup_distribution_plot"), # Gráfico de distribuição
                         style="flex: 1; margin-right: 10px;"
                     ),
                     ui.div(
                         ui.h4("Evolução Temporal RUP vs Não-RUP", style="text-align: center; color: #8A2BE2; margin-bottom: 15px;"),
-                        ui.output_plot("temporal_plot"), # Gráfico temporal
+                        output_chart("temporal_plot"), # Gráfico temporal
                         style="flex: 1; margin-left: 10px;"
                     ),
                     style="display: flex; gap: 20px; margin-top: 20px;"
@@ -510,7 +1637,7 @@ app_ui = ui.page_fluid(
                 ui.div(
                     ui.div(
                         ui.h4("Distribuição por Grupos", style="text-align: center; color: #8A2BE2; margin-bottom: 15px;"),
-                        ui.output_plot("segmentation_bar_plot"),
+                        output_chart("segmentation_bar_plot"),
                         style="flex: 1; margin-right: 10px;"
                     ),
                     ui.div(
@@ -546,6 +1673,60 @@ app_ui = ui.page_fluid(
 )
 
 
+# ======================================================================================
+# ATUALIZAÇÃO EM DUAS CAMADAS
+# Os gráficos e tabelas pesados só recalculam ao clicar em "Calcular Gráficos". Uma prévia
+# acompanha os controles: a contagem RUP (consulta O(1) ao índice pré-calculado) a cada
+# mudança, e o tamanho dos grupos (que percorre os usuários) com debounce, para que arrastar
+# um slider não enfileire um recálculo por passo.
+# ======================================================================================
+
+PREVIEW_DEBOUNCE_SECONDS = 0.4
+
+def debounce(delay_secs, watch):
+    """Decorador de reactive.Calc calculado só após delay_secs sem mudanças nos inputs lidos por
+    watch (função barata que apenas lê os inputs brutos de que o cálculo depende)"""
+    def wrapper(fn):
+        pending_until = reactive.Value(None)
+        trigger = reactive.Value(0)
+        started = False
+
+        # Cada mudança nos inputs brutos reinicia o prazo, sem executar fn
+        @reactive.Effect(priority=102)
+        def restart_timer():
+            nonlocal started
+            try:
+                watch()
+            except SilentException:
+                pass
+            # O primeiro valor já é calculado diretamente por debounced()
+            if not started:
+                started = True
+                return
+            pending_until.set(time.monotonic() + delay_secs)
+
+        @reactive.Effect(priority=101)
+        def fire_when_quiet():
+            deadline = pending_until()
+            if deadline is None:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                reactive.invalidate_later(remaining)
+                return
+            with reactive.isolate():
+                pending_until.set(None)
+                trigger.set(trigger() + 1)
+
+        @reactive.Calc
+        @reactive.event(trigger, ignore_none=False)
+        def debounced():
+            return fn()
+
+        return debounced
+    return wrapper
+
+
 # ======================================================================================
 # 3. A LÓGICA DO SERVIDOR (SERVER)
 # Define como as entradas (sliders) afetam as saídas (KPIs e gráfico).
@@ -553,6 +1734,143 @@ app_ui = ui.page_fluid(
 
 def server(input, output, session):
     
+    # Monitoramento de memória: figuras que continuam vivas quando a sessão termina
+    session.on_ended(lambda: logger.info("Sessão encerrada; figuras em uso no processo: %d", figures_in_use()))
+    
+    # Camada pesada: recalcula apenas quando o botão é clicado (antes do primeiro clique,
+    # cada saída mostra seu aviso). Gráficos que mudam de forma conforme a visualização da
+    # segmentação também respondem à troca de visualização.
+    on_calculate = reactive.event(input.calculate_btn, ignore_none=False)
+    
+    # Saídas de gráfico não bloqueantes: quando um dos gatilhos (ou o tamanho da saída) muda,
+    # a função do gráfico roda no ciclo reativo apenas até o seu yield, lendo as entradas e os
+    # cálculos reativos; o restante (agregação e montagem da figura) e a rasterização rodam
+    # numa ExtendedTask no PLOT_EXECUTOR. Depois do yield a função não pode ler entradas.
+    # Enquanto a tarefa roda a saída fica em estado "ocupado" e o restante da página continua
+    # respondendo. Saídas ocultas só são calculadas quando aparecem.
+    # Cada pedido recebe uma geração; pedidos superados por um mais recente são pulados
+    # (se ainda não começaram) ou descartados, mantendo a imagem anterior até a nova chegar.
+    # Antes de montar a figura, a imagem é procurada no FIGURE_CACHE pelo estado da figura e
+    # pelo tamanho da saída; num acerto o matplotlib não é usado. Quando só o tamanho (ou a
+    # densidade de pixels) muda, a saída é redesenhada a partir do estado do último cálculo,
+    # nunca das entradas atuais: a imagem desse estado no novo tamanho ou a figura serializada
+    # guardada no FIGURE_CACHE; sem nenhuma das duas, a função do gráfico só roda de novo se
+    # as entradas ainda forem as do clique (senão, a imagem atual é mantida).
+    def offloaded_plot(*triggers):
+        def decorator(figure_fn):
+            name = figure_fn.__name__
+            width = input[f".clientdata_output_{name}_width"]
+            height = input[f".clientdata_output_{name}_height"]
+            hidden = input[f".clientdata_output_{name}_hidden"]
+            pixelratio = input[".clientdata_pixelratio"]
+            latest_generation = 0
+            # Valores dos gatilhos e estado da figura no último cálculo (None antes do clique)
+            built = {'triggers': None, 'state': None}
+
+            @reactive.extended_task
+            async def rasterize(figure, width_px, height_px, ratio, key, source_key, generation):
+                def is_current():
+                    return generation == latest_generation
+
+                if isinstance(figure, bytes):
+                    return figure
+                image = None
+                try:
+                    if is_current():
+                        # Erros ao montar a figura aparecem na própria saída, como no render.plot
+                        if isinstance(figure, Exception):
+                            raise figure
+                        loop = asyncio.get_running_loop()
+                        image = await loop.run_in_executor(
+                            PLOT_EXECUTOR, figure_bytes_if_current, is_current, figure, width_px, height_px,
+                            ratio, plot_format(name), source_key)
+                finally:
+                    release_figure(figure)
+                if image is not None and key is not None:
+                    store_figure(key, image)
+                if image is None or not is_current():
+                    # Superado por um pedido mais recente, já na fila: não apagar a saída
+                    raise SilentCancelOutputException()
+                return image
+
+            @reactive.Effect
+            @reactive.event(*triggers, width, height, hidden, pixelratio, ignore_none=False)
+            def start_rendering():
+                nonlocal latest_generation
+                if hidden():
+                    return
+                size = (width(), height(), pixelratio())
+                trigger_values = [trigger() for trigger in triggers]
+                key = source_key = figure = None
+                if trigger_values == built['triggers'] and built['state'] is not None:
+                    # Só o tamanho mudou: a figura do último cálculo, no novo tamanho
+                    key = figure_cache_key(name, built['state'], *size)
+                    source_key = figure_source_key(name, built['state'])
+                    figure = cached_figure(key)
+                    if figure is None:
+                        source = cached_figure(source_key)
+                        if source is not None:
+                            figure = PickledFigure(source)
+                        else:
+                            # Figura ainda em montagem ou fora do cache: montar de novo apenas
+                            # se as entradas não mudaram desde o clique; senão, manter a imagem
+                            try:
+                                unchanged = figure_state() == built['state']
+                            except SilentException:
+                                unchanged = False
+                            if not unchanged:
+                                return
+                # Antes do primeiro cálculo a saída mostra só o aviso: sem cache e sem ler os filtros
+                elif input.calculate_btn():
+                    try:
+                        state = figure_state()
+                        key = figure_cache_key(name, state, *size)
+                        source_key = figure_source_key(name, state)
+                        figure = cached_figure(key)
+                    except SilentException:
+                        # Algum filtro ainda sem valor: tratar como ausência no cache
+                        state = key = None
+                    built.update(triggers=trigger_values, state=state)
+                else:
+                    built.update(triggers=trigger_values, state=None)
+                if figure is None:
+                    try:
+                        # Até o yield (ou até um return antecipado, ex.: estado vazio)
+                        figure = figure_fn()
+                        if isinstance(figure, GeneratorType):
+                            try:
+                                next(figure)
+                            except StopIteration as stop:
+                                figure = stop.value
+                    except SilentException:
+                        raise
+                    except Exception as e:
+                        figure = e
+                latest_generation += 1
+                rasterize.invoke(figure, *size, key, source_key, latest_generation)
+
+            @render_figure
+            @functools.wraps(figure_fn)
+            def rendered():
+                return rasterize.result()
+
+            return rendered
+        return decorator
+    
+    # Saídas de CLIENT_CHARTS: no modo 'client', a saída envia os agregados de chart_fn ao
+    # charts.js em vez da figura; no modo 'server', a figura segue pelo offloaded_plot
+    def chart_or_plot(chart_fn, *triggers):
+        if CHART_MODE != 'client':
+            return offloaded_plot(*triggers)
+        def decorator(figure_fn):
+            @render_chart
+            @functools.wraps(figure_fn)
+            @reactive.event(*triggers, ignore_none=False)
+            def rendered():
+                return chart_fn()
+            return rendered
+        return decorator
+    
     @output
     @render.ui
     def segmentation_analysis_ui():
@@ -582,7 +1900,7 @@ def server(input, output, session):
                 ),
                 ui.div(
                     ui.h4("Interações por Tipo de Dispositivo", style="text-align: center; color: #8A2BE2; margin-bottom: 15px;"),
-                    ui.output_plot("device_interactions_plot"),
+                    output_chart("device_interactions_plot"),
                     style="flex: 1; margin-left: 10px;"
                 ),
                 style="display: flex; gap: 20px; margin-top: 20px;"
@@ -596,124 +1914,221 @@ def server(input, output, session):
         # Como não podemos modificar diretamente os inputs, vamos usar uma abordagem diferente
         pass
 
-    # Função para criar grupos baseados em faixas personalizadas
-    def create_custom_groups(df, var_name, num_groups):
-        """Cria grupos baseados nas faixas personalizadas definidas pelo usuário"""
+    # Seleção atual dos filtros cruzados: (tipos de dispositivo, classes de evento); None = sem filtro
+    def cross_filter_selection():
+        if not input.enable_cross_filters():
+            return None, None
+        return cross_filter_input('filter_device_types'), cross_filter_input('filter_event_classes')
+
+    # Seleção de um filtro cruzado; enquanto o controle ainda não existe na página, nenhum filtro
+    def cross_filter_input(name):
+        try:
+            return list(input[name]()) or None
+        except SilentException:
+            return None
+
+    # Estado normalizado dos filtros que determinam os dados agregados (chave do cache entre sessões)
+    @reactive.Calc
+    def filter_state():
+        num_groups = input.num_groups()
+        thresholds = []
+        for i in range(num_groups - 1):
+            try:
+                thresholds.append(getattr(input, f'threshold_{i}')())
+            except Exception:
+                thresholds.append(None)
+        device_types, event_classes = cross_filter_selection()
+        return {
+            'rup_thresholds': [input.min_sessoes(), input.min_semanas(), input.min_interacoes(),
+                               input.min_dias(), input.min_features()],
+            'date_range': list(input.date_range() or []),
+            'show_rup_only': input.show_rup_only(),
+            'show_post_mari': input.show_post_mari(),
+            'segmentation_variable': input.segmentation_variable(),
+            'num_groups': num_groups,
+            'thresholds': thresholds,
+            'device_types': sorted(device_types or []),
+            'event_classes': sorted(event_classes or []),
+            'first_interactions': input.first_interactions(),
+        }
+
+    # Estado que determina uma figura: filtros e opções de exibição (chave do FIGURE_CACHE)
+    @reactive.Calc
+    def figure_state():
+        return {
+            'filters': filter_state(),
+            'calculated': bool(input.calculate_btn()),
+            'segmentation_view': input.segmentation_view(),
+            'chart_scale': input.chart_scale(),
+            'y_axis_max': input.y_axis_max(),
+        }
+
+    # aggregate_interactions com cache entre sessões; `cohort` identifica, dentro do estado
+    # dos filtros, a qual coorte pertencem os user_codes informados. Os filtros são lidos aqui,
+    # no ciclo reativo; a função retornada busca (ou calcula) o resultado sem ler entradas e
+    # pode ser chamada depois do yield dos gráficos, numa thread do PLOT_EXECUTOR
+    def cached_interactions(cohort, user_codes, by, **options):
+        params = {'filters': filter_state(), 'cohort': cohort, 'by': by}
+        for name, value in options.items():
+            if name != 'groups':
+                params[name] = sorted(value) if isinstance(value, list) else value
+        return functools.partial(cached_result, 'interactions', params,
+                                 lambda: aggregate_interactions(user_codes, by, **options))
+
+    # Funções auxiliares para criar grupos baseados em faixas personalizadas
+    def equal_split_edges(var_name, num_groups):
+        """Limites internos que dividem a amplitude da variável em num_groups faixas iguais"""
+        data = df_users[var_name]
+        min_val = data.min()
+        max_val = data.max()
+        if var_name == 'first_seen':
+            # Para datas (já normalizadas no carregamento), limites em dias inteiros
+            days_diff = (max_val - min_val).days
+            return [pd.Timestamp.fromordinal(round(min_val.toordinal() + i * days_diff / num_groups))
+                    for i in range(1, num_groups)]
+        # Para variáveis numéricas, limites inteiros
+        return [round(min_val + i * (max_val - min_val) / num_groups) for i in range(1, num_groups)]
+
+    def threshold_edges(var_name, thresholds):
+        """Converte os limites para um array ordenado comparável à coluna (datetime64[ns] ou float)"""
+        # Limite vazio (None, NaN ou NaT) não tem posição na ordenação nem no searchsorted
+        if any(pd.isna(t) for t in thresholds):
+            raise ValueError("Os limites das faixas devem estar preenchidos")
+        if var_name == 'first_seen':
+            edges = np.array([pd.Timestamp(t).to_datetime64() for t in thresholds], dtype='datetime64[ns]')
+        else:
+            edges = np.asarray(thresholds, dtype=np.float64)
+        edges = np.sort(edges)
+        if len(np.unique(edges)) < len(edges):
+            raise ValueError("Os limites das faixas devem ser distintos")
+        return edges
+
+    def group_categories(num_groups):
+        """Rótulos na ordem dos códigos: código 0 = menor faixa = Grupo N, ..., código N-1 = Grupo 1"""
+        return [f'Grupo {num_groups - code}' for code in range(num_groups)]
+
+    # Etapa única de atribuição de grupos: código int8 da faixa de cada usuário de df_users
+    # (-1 = sem grupo), obtido com np.searchsorted sobre os limites. Equivale a pd.cut com
+    # intervalos fechados à direita. Recalculada apenas quando a variável, o número de grupos
+    # ou algum threshold_i muda, e compartilhada por todos os gráficos de segmentação.
+    @reactive.Calc
+    def group_codes():
+        var_name = input.segmentation_variable()
+        num_groups = input.num_groups()
+        if num_groups == 1:
+            return np.zeros(len(df_users), dtype=np.int8)
+
         try:
-            if num_groups == 1:
-                return pd.Series(['Grupo 1'] * len(df), index=df.index)
-            
             # Obter os limites definidos pelo usuário
             thresholds = []
             for i in range(num_groups - 1):
                 try:
-                    threshold = getattr(input, f'threshold_{i}')()
-                    thresholds.append(threshold)
+                    value = getattr(input, f'threshold_{i}')()
                 except Exception:
-                    # Fallback para distribuição igual se não conseguir obter o valor
-                    if var_name == 'first_seen':
-                        # Para datas, converter para datetime
-                        dates = pd.to_datetime(df[var_name]).dt.tz_localize(None)
-                        min_val = dates.min()
-                        max_val = dates.max()
-                        days_diff = (max_val - min_val).days
-                        threshold_days = round(min_val.toordinal() + (i + 1) * days_diff / num_groups)
-                        threshold = pd.Timestamp.fromordinal(threshold_days).date()
-                    else:
-                        # Para variáveis numéricas
-                        min_val = df[var_name].min()
-                        max_val = df[var_name].max()
-                        threshold = round(min_val + (i + 1) * (max_val - min_val) / num_groups)
-                    thresholds.append(threshold)
-            
-            # Ordenar os limites
-            thresholds = sorted(thresholds)
-            
-            # Criar os grupos usando pd.cut com os limites personalizados
-            if var_name == 'first_seen':
-                # Para datas, converter para datetime e criar bins
-                dates = pd.to_datetime(df[var_name]).dt.tz_localize(None)
-                min_val = dates.min()
-                max_val = dates.max()
-                bins = [min_val] + [pd.to_datetime(t) for t in thresholds] + [max_val]
-                bins[0] = pd.Timestamp.min  # Para incluir o valor mínimo
-                bins[-1] = pd.Timestamp.max  # Para incluir o valor máximo
-            else:
-                # Para variáveis numéricas
-                bins = [df[var_name].min()] + thresholds + [df[var_name].max()]
-                bins[0] = float('-inf')  # Para incluir o valor mínimo
-                bins[-1] = float('inf')  # Para incluir o valor máximo
-            
-            # Criar grupos com labels invertidos: Grupo 1 = melhor (maior valor), Grupo N = pior (menor valor)
-            labels = [f'Grupo {i+1}' for i in range(num_groups)]
-            groups = pd.cut(df[var_name], bins=bins, labels=labels)
-            
-            # Inverter a ordem dos grupos para que Grupo 1 seja o melhor (maior valor)
-            group_mapping = {f'Grupo {i+1}': f'Grupo {num_groups-i}' for i in range(num_groups)}
-            groups = groups.map(group_mapping)
-            
-            return groups
+                    value = None
+                # Fallback para distribuição igual se não conseguir obter o valor ou o campo estiver vazio
+                thresholds.append(equal_split_edges(var_name, num_groups)[i] if pd.isna(value) else value)
+            edges = threshold_edges(var_name, thresholds)
         except Exception as e:
             print(f"Erro na criação de grupos: {e}")
             # Fallback para distribuição igual
             try:
-                if var_name == 'first_seen':
-                    # Para datas, converter para datetime
-                    dates = pd.to_datetime(df[var_name]).dt.tz_localize(None)
-                    min_val = dates.min()
-                    max_val = dates.max()
-                    days_diff = (max_val - min_val).days
-                    bins = [pd.Timestamp.fromordinal(round(min_val.toordinal() + i * days_diff / num_groups)) for i in range(num_groups + 1)]
-                    bins[0] = pd.Timestamp.min
-                    bins[-1] = pd.Timestamp.max
-                else:
-                    # Para variáveis numéricas
-                    min_val = df[var_name].min()
-                    max_val = df[var_name].max()
-                    # Calcular bins com distribuição igual usando números inteiros
-                    bins = [round(min_val + i * (max_val - min_val) / num_groups) for i in range(num_groups + 1)]
-                    bins[0] = float('-inf')
-                    bins[-1] = float('inf')
-                
-                groups = pd.cut(df[var_name], bins=bins, labels=[f'Grupo {i+1}' for i in range(num_groups)])
-                
-                # Inverter a ordem dos grupos para que Grupo 1 seja o melhor (maior valor)
-                group_mapping = {f'Grupo {i+1}': f'Grupo {num_groups-i}' for i in range(num_groups)}
-                groups = groups.map(group_mapping)
-                return groups
-            except:
-                return pd.Series(['Grupo 1'] * len(df), index=df.index)
+                edges = threshold_edges(var_name, equal_split_edges(var_name, num_groups))
+            except Exception:
+                # Todos os usuários no Grupo 1
+                return np.full(len(df_users), num_groups - 1, dtype=np.int8)
+
+        values = df_users[var_name].to_numpy()
+        codes = np.searchsorted(edges, values, side='left').astype(np.int8)
+        missing = np.isnat(values) if var_name == 'first_seen' else pd.isna(values)
+        codes[missing] = -1
+        return codes
+
+    def with_groups(df, index):
+        """Acrescenta a coluna categórica 'group' às linhas de df_users selecionadas por index"""
+        groups = pd.Categorical.from_codes(group_codes()[index], categories=group_categories(input.num_groups()))
+        return df.assign(group=groups)
 
     # @reactive.Calc: O coração da reatividade.
-    # Esta função recalcula o DataFrame sempre que um slider muda.
+    # Máscara booleana dos usuários RUP sobre df_users, recalculada sempre que um slider
+    # muda. Não copia a tabela: compara diretamente os arrays das variáveis RUP.
     @reactive.Calc
-    def calculate_rup():
-        # Pega os valores atuais dos sliders
-        rup_min_sessoes = input.min_sessoes()
-        rup_min_semanas = input.min_semanas()
-        rup_min_interacoes = input.min_interacoes()
-        rup_min_dias = input.min_dias()
-        rup_min_features = input.min_features()
-
-        # Cria uma cópia para não alterar o DataFrame original
-        df = df_users.copy()
-        
-        # Renomear coluna uid para unique_id se existir, senão criar usando o índice
-        if 'uid' in df.columns:
-            df = df.rename(columns={'uid': 'unique_id'})
-        elif 'unique_id' not in df.columns:
-            df['unique_id'] = df.index.astype(str)
-        
-        # Aplica a lógica de RUP com os valores dinâmicos dos sliders
-        df["in_RUP"] = (
-            (df["sessions_days"] >= rup_min_sessoes) &
-            (df["weeks_active"] >= rup_min_semanas) &
-            (df["events_total"] >= rup_min_interacoes) &
-            (df["days_active"] >= rup_min_dias) &
-            (df["features_distinct"] >= rup_min_features)
-        )
+    def rup_mask():
+        thresholds = {
+            'sessions_days': input.min_sessoes(),
+            'weeks_active': input.min_semanas(),
+            'events_total': input.min_interacoes(),
+            'days_active': input.min_dias(),
+            'features_distinct': input.min_features(),
+        }
+        mask = np.ones(len(df_users), dtype=bool)
+        for col, value in thresholds.items():
+            # Variável ausente nos dados: não restringe
+            if col in RUP_VALUES:
+                mask &= RUP_VALUES[col] >= value
+        return mask
+
+    # Etapa compartilhada de filtragem da coorte: aplica uma única vez por ciclo
+    # reativo os filtros de visualização (apenas RUP, pós-Mari IA e período) que
+    # antes eram repetidos em cada gráfico. Retorna as posições (em df_users) dos
+    # usuários da coorte.
+    @reactive.Calc
+    def filtered_cohort_index():
+        mask = np.ones(len(df_users), dtype=bool)
+
+        if input.show_rup_only():
+            mask &= rup_mask()
+
+        # first_seen já está sem timezone; os filtros usam os códigos inteiros de dia
+        if input.show_post_mari():
+            # Filtrar dados após agosto de 2024
+            mask &= FIRST_SEEN_DAY >= date_to_day_code('2024-08-01')
+
+        # Aplicar filtro de data (comparação por dia, equivalente a .dt.date)
+        date_range = input.date_range()
+        if date_range and len(date_range) == 2:
+            start_date, end_date = date_range
+            mask &= (FIRST_SEEN_DAY >= date_to_day_code(start_date)) & (FIRST_SEEN_DAY <= date_to_day_code(end_date))
+
+        return np.flatnonzero(mask)
+
+    # Coorte filtrada como DataFrame (apenas as linhas selecionadas, com a coluna in_RUP).
+    # O resultado é memoizado pelo Shiny e não deve ser alterado pelos consumidores
+    # (use .assign() para novas colunas).
+    @reactive.Calc
+    def filtered_cohort():
+        index = filtered_cohort_index()
+        df = df_users.take(index)
+        df['in_RUP'] = rup_mask()[index]
         return df
 
+    # Posições dos usuários RUP dentro da coorte filtrada
+    @reactive.Calc
+    def filtered_rup_cohort_index():
+        index = filtered_cohort_index()
+        return index[rup_mask()[index]]
+
+    # Coorte filtrada restrita aos usuários RUP (base da segmentação)
+    @reactive.Calc
+    def filtered_rup_cohort():
+        df = df_users.take(filtered_rup_cohort_index())
+        df['in_RUP'] = True
+        return df
+
+    # Coortes com a coluna 'group' já atribuída, compartilhadas pelos gráficos de segmentação
+    @reactive.Calc
+    def segmented_cohort():
+        return with_groups(filtered_cohort(), filtered_cohort_index())
+
+    @reactive.Calc
+    def segmented_rup_cohort():
+        return with_groups(filtered_rup_cohort(), filtered_rup_cohort_index())
+
+    # Indica se existe algum usuário RUP antes dos filtros de visualização
+    @reactive.Calc
+    def has_rup_users():
+        return bool(rup_mask().any())
+
     # Renderiza os controles dinâmicos de faixas
     @output
     @render.ui
@@ -730,8 +2145,8 @@ def server(input, output, session):
             inputs = []
             
             if var_name == 'first_seen':
-                # Tratar datas de forma especial
-                dates = pd.to_datetime(df_users[var_name]).dt.tz_localize(None)
+                # Tratar datas de forma especial (já normalizadas no carregamento)
+                dates = df_users[var_name]
                 min_val = dates.min().date()
                 max_val = dates.max().date()
                 
@@ -804,11 +2219,12 @@ def server(input, output, session):
             if df_interactions.empty:
                 return ui.p("Dados de interações não disponíveis para filtros", style="color: red;")
             
-            # Obter tipos de dispositivo únicos
-            device_types = sorted(df_interactions['user_agent_device_type'].dropna().unique()) if 'user_agent_device_type' in df_interactions.columns else []
+            # Obter tipos de dispositivo e classificações de evento únicos
+            device_types = cross_filter_options('user_agent_device_type')
+            event_classes = cross_filter_options('event_classification')
             
-            # Obter classificações de evento únicas
-            event_classes = sorted(df_interactions['event_classification'].dropna().unique()) if 'event_classification' in df_interactions.columns else []
+            # Contagem de interações ao lado de cada opção (atualizada por update_cross_filter_facets)
+            facets = cross_filter_facets()
             
             controls = []
             
@@ -817,7 +2233,7 @@ def server(input, output, session):
                     ui.input_selectize(
                         "filter_device_types",
                         "Filtrar por Tipo de Dispositivo",
-                        choices={dt: dt for dt in device_types},
+                        choices=facet_choices(device_types, facets['user_agent_device_type']),
                         selected=[],
                         multiple=True
                     )
@@ -828,7 +2244,7 @@ def server(input, output, session):
                     ui.input_selectize(
                         "filter_event_classes",
                         "Filtrar por Classificação de Evento",
-                        choices={ec: ec for ec in event_classes},
+                        choices=facet_choices(event_classes, facets['event_classification']),
                         selected=[],
                         multiple=True
                     )
@@ -845,36 +2261,52 @@ def server(input, output, session):
         except Exception as e:
             return ui.p(f"Erro ao carregar filtros cruzados: {str(e)}", style="color: red;")
 
+    # Opções disponíveis em um filtro cruzado
+    def cross_filter_options(column):
+        return sorted(df_interactions[column].dropna().unique()) if column in df_interactions.columns else []
+
+    # Contagens ao lado das opções de cada filtro acompanham a seleção do outro filtro;
+    # a seleção atual é preservada, então a atualização não dispara novo cálculo
+    @reactive.Effect
+    def update_device_facets():
+        if not input.enable_cross_filters():
+            return
+        facets = cross_filter_facets(event_classes=list(input.filter_event_classes()) or None)
+        with reactive.isolate():
+            selected = list(input.filter_device_types())
+        ui.update_selectize(
+            "filter_device_types", selected=selected,
+            choices=facet_choices(cross_filter_options('user_agent_device_type'), facets['user_agent_device_type']))
+
+    @reactive.Effect
+    def update_event_facets():
+        if not input.enable_cross_filters():
+            return
+        facets = cross_filter_facets(device_types=list(input.filter_device_types()) or None)
+        with reactive.isolate():
+            selected = list(input.filter_event_classes())
+        ui.update_selectize(
+            "filter_event_classes", selected=selected,
+            choices=facet_choices(cross_filter_options('event_classification'), facets['event_classification']))
 
-    # Função para identificar usuários extremos
+
+    # Função para identificar usuários extremos (memoizada: compartilhada entre
+    # o painel de informações e os gráficos de trajetória)
+    @reactive.Calc
     def get_extreme_users():
         """Identifica o melhor e pior usuário baseado na variável de segmentação selecionada"""
         try:
-            df_rup = calculate_rup()
-            df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if df_rup.empty:
+            if not has_rup_users():
                 return None, None, None
-            
+
             var_name = input.segmentation_variable()
-            
-            if var_name not in df_rup.columns:
+
+            if var_name not in df_users.columns:
                 return None, None, None
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
-            
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
-            
+
+            # Coorte RUP já filtrada (período, Mari IA)
+            df_rup = filtered_rup_cohort()
+
             if df_rup.empty:
                 return None, None, None
             
@@ -898,6 +2330,7 @@ def server(input, output, session):
     # Renderiza informações dos usuários extremos
     @output
     @render.ui
+    @on_calculate
     def extreme_users_info():
         """Exibe informações dos usuários extremos selecionados"""
         try:
@@ -938,51 +2371,58 @@ def server(input, output, session):
         except Exception as e:
             return ui.p(f"Erro ao carregar informações dos usuários: {str(e)}", style="color: red; text-align: center;")
 
+    # Camada de prévia: contagem RUP sem debounce (consulta ao cubo pré-calculado, não depende
+    # de rup_mask())
+    @reactive.Calc
+    def preview_rup_count():
+        if RUP_COUNT_INDEX is None:
+            return int(np.count_nonzero(rup_mask()))
+        thresholds = (input.min_sessoes(), input.min_semanas(), input.min_interacoes(),
+                      input.min_dias(), input.min_features())
+        return rup_user_count(RUP_COUNT_INDEX, thresholds)
+
+    # Inputs brutos que determinam o tamanho dos grupos: só eles reiniciam o debounce da prévia
+    def group_size_inputs():
+        for name in ('min_sessoes', 'min_semanas', 'min_interacoes', 'min_dias', 'min_features',
+                     'show_rup_only', 'show_post_mari', 'date_range', 'segmentation_variable'):
+            input[name]()
+        for i in range(input.num_groups() - 1):
+            try:
+                input[f'threshold_{i}']()
+            except SilentException:
+                pass
+
+    # Usuários RUP da coorte filtrada em cada grupo da segmentação, com debounce sobre os controles
+    @debounce(PREVIEW_DEBOUNCE_SECONDS, watch=group_size_inputs)
+    def preview_group_sizes():
+        num_groups = input.num_groups()
+        codes = group_codes()[filtered_rup_cohort_index()]
+        sizes = np.bincount(codes[codes >= 0], minlength=num_groups)
+        return dict(zip(group_categories(num_groups), sizes))
+
     # Renderiza o painel de KPIs
     @output
     @render.ui
     def kpi_panel():
-        df_rup = calculate_rup()
-        rup_count = df_rup["in_RUP"].sum()
+        rup_count = preview_rup_count()
+        group_sizes = preview_group_sizes()
         rup_percentage = (rup_count / TOTAL_USERS) * 100
+        group_text = " | ".join(f"{group}: {size:,.0f}".replace(",", ".")
+                                for group, size in reversed(group_sizes.items()))
 
         return ui.div(
             ui.h3("Resultados da Simulação"),
             ui.p(f"Número de usuários na RUP: {rup_count:,.0f}".replace(",", ".")),
             ui.p(f"Percentual do Total: {rup_percentage:.2f}%"),
+            ui.p(f"Usuários RUP por grupo: {group_text}"),
             class_="kpi-panel"
         )
 
-    # Renderiza o gráfico de barras
-    @output
-    @render.plot
-    def rup_distribution_plot():
-        # Verificar se o botão foi clicado
-        if not input.calculate_btn():
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Distribuição de Usuários RUP', fontsize=14, fontweight='bold')
-            return fig
-        
-        df_rup = calculate_rup()
-        
-        # Aplicar filtros temporais
-        if input.show_rup_only():
-            df_rup = df_rup[df_rup["in_RUP"] == True].copy()
-        
-        if input.show_post_mari():
-            # Filtrar dados após agosto de 2024
-            df_rup = df_rup[df_rup["first_seen"] >= "2024-08-01"].copy()
-        
-        # Aplicar filtro de data
-        date_range = input.date_range()
-        if date_range and len(date_range) == 2:
-            start_date, end_date = date_range
-            # Converter first_seen para datetime se necessário e remover timezone
-            df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-            df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
-        
-        counts = df_rup["in_RUP"].value_counts().sort_index()
+    # Usuários da coorte dentro e fora da RUP (RUP primeiro)
+    @reactive.Calc
+    def rup_distribution_counts():
+        # Coorte com filtros de visualização já aplicados (etapa compartilhada)
+        counts = pd.Series(rup_mask()[filtered_cohort_index()]).value_counts().sort_index()
         
         # Criar um novo Series com a ordem correta: RUP=True primeiro, RUP=False segundo
         if len(counts) == 2:
@@ -1001,11 +2441,36 @@ def server(input, output, session):
             # Fallback se não houver dados
             ordered_counts = pd.Series([0, 0], index=['RUP', 'Não RUP'])
         
-        # Configurar o estilo do matplotlib
-        plt.style.use('default')
-        setup_montserrat_font()
+        return ordered_counts
+
+    def rup_distribution_chart():
+        if not input.calculate_btn():
+            return {'title': 'Distribuição de Usuários RUP', 'message': 'Clique em "Calcular Gráficos" para visualizar os dados'}
+        counts = rup_distribution_counts()
+        return {
+            'kind': 'bar',
+            'title': 'Distribuição de Usuários Dentro e Fora da RUP',
+            'xlabel': 'Categoria de Usuário',
+            'ylabel': 'Quantidade de Usuários',
+            'labels': counts.index.tolist(),
+            'series': [{'name': 'Usuários', 'values': counts.tolist(), 'colors': ["#8A2BE2", "#808080"]}],
+            'value_labels': True,
+            'percent_labels': True,
+        }
+
+    # Renderiza o gráfico de barras
+    @output
+    @chart_or_plot(rup_distribution_chart, input.calculate_btn)
+    def rup_distribution_plot():
+        # Verificar se o botão foi clicado
+        if not input.calculate_btn():
+            return empty_state_image('Distribuição de Usuários RUP', 'Clique em "Calcular Gráficos" para visualizar os dados')
         
-        fig, ax = plt.subplots(figsize=(3, 4))
+        ordered_counts = rup_distribution_counts()
+        
+        yield
+        
+        fig, ax = figure_subplots(figsize=(3, 4))
         
         # Cores personalizadas: RUP=True (#8A2BE2), RUP=False (cinza)
         colors = ["#8A2BE2", "#808080"]  # Roxo para RUP=True, Cinza para RUP=False
@@ -1040,56 +2505,22 @@ def server(input, output, session):
         ax.spines['bottom'].set_color('#ccc')
         
         # Ajustar layout
-        plt.tight_layout()
+        fig.tight_layout()
         
         return fig
 
-    # Renderiza o gráfico temporal
-    @output
-    @render.plot
-    def temporal_plot():
-        # Verificar se o botão foi clicado
-        if not input.calculate_btn():
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Evolução Temporal RUP vs Não RUP', fontsize=14, fontweight='bold')
-            return fig
-        
-        df_rup = calculate_rup().copy()  # Criar uma cópia para evitar warnings
-        
-        # Aplicar filtros de visualização
-        if input.show_rup_only():
-            df_rup = df_rup[df_rup["in_RUP"] == True].copy()
-        
-        if input.show_post_mari():
-            # Filtrar dados após agosto de 2024
-            df_rup = df_rup[df_rup["first_seen"] >= "2024-08-01"].copy()
-        
-        # Aplicar filtro de data
-        date_range = input.date_range()
-        if date_range and len(date_range) == 2:
-            start_date, end_date = date_range
-            # Converter first_seen para datetime se necessário e remover timezone
-            df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-            df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
-        else:
-            # Converter first_seen para datetime se necessário, removendo timezone se existir
-            df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-        
-        # Verificar se temos dados suficientes
-        if len(df_rup) == 0:
-            # Criar um gráfico vazio se não houver dados
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, 'Nenhum dado disponível\ncom os filtros selecionados', 
-                   ha='center', va='center', transform=ax.transAxes, 
-                   fontsize=12, color='#666')
-            ax.set_title("Evolução Temporal", fontsize=14, fontweight='600', color='#8A2BE2', pad=15)
-            return fig
+    # Novos usuários da coorte por mês, em colunas 'RUP' e 'Não RUP' (índice Period mensal)
+    @reactive.Calc
+    def monthly_rup_counts():
+        index = filtered_cohort_index()
         
         # Sempre agrupar por mês para evolução temporal RUP vs não RUP
-        df_rup['period'] = df_rup['first_seen'].dt.to_period('M')
-        period_counts = df_rup.groupby(['period', 'in_RUP'], observed=True).size().unstack(fill_value=0)
-        period_label = "Mês"
+        # Usa o código de mês pré-calculado e converte só o índice agregado em Period
+        months = FIRST_SEEN_MONTH[index]
+        valid = months != MONTH_CODE_NA
+        df_months = pd.DataFrame({'first_seen_month': months[valid], 'in_RUP': rup_mask()[index][valid]})
+        period_counts = df_months.groupby(['first_seen_month', 'in_RUP'], observed=True).size().unstack(fill_value=0)
+        period_counts.index = month_codes_to_periods(period_counts.index)
         
         # Renomear colunas para melhor visualização
         if True in period_counts.columns:
@@ -1097,14 +2528,53 @@ def server(input, output, session):
         if False in period_counts.columns:
             period_counts['Não RUP'] = period_counts[False]
         
-        # Remover colunas booleanas originais
-        period_counts = period_counts.drop(columns=[col for col in period_counts.columns if col in [True, False]], errors='ignore')
+        # Remover colunas booleanas originais
+        period_counts = period_counts.drop(columns=[col for col in period_counts.columns if col in [True, False]], errors='ignore')
+        return period_counts
+
+    def temporal_chart():
+        if not input.calculate_btn():
+            return {'title': 'Evolução Temporal RUP vs Não RUP', 'message': 'Clique em "Calcular Gráficos" para visualizar os dados'}
+        if len(filtered_cohort_index()) == 0:
+            return {'title': 'Evolução Temporal', 'message': 'Nenhum dado disponível\ncom os filtros selecionados'}
+        period_counts = monthly_rup_counts()
+        labels = period_counts.index.astype(str).tolist()
+        chart = {
+            'kind': 'line',
+            'title': 'Evolução Temporal',
+            'xlabel': 'Mês',
+            'ylabel': 'Novos Usuários',
+            'labels': labels,
+            'xticks': temporal_tick_positions(labels),
+            'series': [{'name': name, 'values': period_counts[name].tolist(), 'color': color}
+                       for name, color in (('RUP', '#8A2BE2'), ('Não RUP', '#808080'))
+                       if name in period_counts.columns],
+        }
+        if '2024-08' in labels:
+            chart['marker'] = {'at': '2024-08', 'label': 'Mari IA', 'color': '#f72585'}
+        return chart
+
+    # Renderiza o gráfico temporal
+    @output
+    @chart_or_plot(temporal_chart, input.calculate_btn)
+    def temporal_plot():
+        # Verificar se o botão foi clicado
+        if not input.calculate_btn():
+            return empty_state_image('Evolução Temporal RUP vs Não RUP', 'Clique em "Calcular Gráficos" para visualizar os dados')
+        
+        # Coorte com filtros de visualização já aplicados
+        index = filtered_cohort_index()
+        
+        # Verificar se temos dados suficientes
+        if len(index) == 0:
+            return empty_state_image('Evolução Temporal', 'Nenhum dado disponível com os filtros selecionados')
+        
+        period_counts = monthly_rup_counts()
+        period_label = "Mês"
         
-        # Configurar o estilo do matplotlib
-        plt.style.use('default')
-        setup_montserrat_font()
+        yield
         
-        fig, ax = plt.subplots(figsize=(3, 4))
+        fig, ax = figure_subplots(figsize=(3, 4))
         
         # Plotar linhas
         if 'RUP' in period_counts.columns:
@@ -1145,7 +2615,7 @@ def server(input, output, session):
         ax.spines['bottom'].set_color('#ccc')
         
         # Ajustar layout
-        plt.tight_layout()
+        fig.tight_layout()
         
         # Adicionar pontos nas linhas para melhor visualização
         if 'RUP' in period_counts.columns:
@@ -1160,70 +2630,42 @@ def server(input, output, session):
 
     # Renderiza o histograma da variável de segmentação
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def segmentation_histogram():
         """Histograma da variável selecionada para segmentação"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Distribuição da Variável de Segmentação', fontsize=14, fontweight='bold')
-                return fig
-            
-            df_rup = calculate_rup()
-            df_rup = df_rup[df_rup['in_RUP'] == True].copy()
+                return empty_state_image('Distribuição da Variável de Segmentação', 'Clique em "Calcular Gráficos" para visualizar os dados')
             
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Distribuição da Variável de Segmentação', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
+            if not has_rup_users():
+                return empty_state_image('Distribuição da Variável de Segmentação', 'Nenhum usuário RUP encontrado')
             
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
-            
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            # Coorte RUP com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_rup_cohort()
             
             
             if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Nenhum dado disponível para os filtros selecionados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Distribuição da Variável de Segmentação', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Distribuição da Variável de Segmentação', 'Nenhum dado disponível para os filtros selecionados')
             
             # Obter parâmetros de segmentação
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
             
+            yield
+            
             if var_name not in df_rup.columns:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, f'Variável {var_name} não encontrada nos dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Distribuição da Variável de Segmentação', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Distribuição da Variável de Segmentação', f'Variável {var_name} não encontrada nos dados')
             
             # Obter dados da variável
             data = df_rup[var_name].dropna()
             
             if data.empty:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Nenhum dado válido para a variável selecionada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Distribuição da Variável de Segmentação', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Distribuição da Variável de Segmentação', 'Nenhum dado válido para a variável selecionada')
             
             # Tratar datas de forma especial
             if var_name == 'first_seen':
-                # Para datas, converter para datetime e usar data filtrada
-                data = pd.to_datetime(data).dt.tz_localize(None)
+                # Para datas (já sem timezone), usar data filtrada
                 data_filtered = data  # Para datas, não filtrar outliers por IQR
             else:
                 # Detectar e excluir outliers severos usando IQR para variáveis numéricas
@@ -1252,11 +2694,7 @@ def server(input, output, session):
                     upper_bound = data.quantile(0.95)
                     data_filtered = data[(data >= lower_bound) & (data <= upper_bound)]
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
-            
-            fig, ax = plt.subplots(figsize=(10, 6))
+            fig, ax = figure_subplots(figsize=(10, 6))
             
             if var_name == 'first_seen':
                 # Para datas, criar histograma temporal
@@ -1327,81 +2765,77 @@ def server(input, output, session):
             ax.text(0.02, 0.90, outlier_info, transform=ax.transAxes, fontsize=9, 
                    verticalalignment='top', bbox=dict(boxstyle='round', facecolor='lightcoral', alpha=0.8))
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no histograma de segmentação: {e}")
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.text(0.5, 0.5, f'Erro ao carregar histograma: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro no Histograma', fontsize=14, fontweight='bold')
-            return fig
+            return empty_state_image('Erro no Histograma', f'Erro ao carregar histograma: {str(e)}')
+
+    # Usuários RUP por grupo de segmentação (Grupo 1 primeiro)
+    @reactive.Calc
+    def segmentation_group_counts():
+        # Grupos das faixas personalizadas (etapa compartilhada de atribuição)
+        df_rup = segmented_rup_cohort()
+        
+        # Contar usuários por grupo e ordenar corretamente (Grupo 1 primeiro)
+        group_counts = df_rup['group'].value_counts()
+        
+        # Ordenar os grupos: Grupo 1, Grupo 2, etc.
+        group_order = sorted(group_counts.index, key=lambda x: int(x.split()[-1]) if isinstance(x, str) and ' ' in x else int(x))
+        return group_counts.reindex(group_order)
+
+    def segmentation_bar_chart():
+        if not input.calculate_btn():
+            return {'title': 'Segmentação dos Usuários Reais', 'message': 'Clique em "Calcular Gráficos" para visualizar os dados'}
+        if not has_rup_users():
+            return {'title': 'Segmentação dos Usuários RUP', 'message': 'Nenhum usuário RUP encontrado'}
+        if filtered_rup_cohort().empty:
+            return {'title': 'Segmentação dos Usuários RUP', 'message': 'Nenhum dado disponível para os filtros selecionados'}
+        group_counts = segmentation_group_counts()
+        colors = plt.cm.RdYlGn_r(np.linspace(0, 1, len(group_counts)))
+        return {
+            'kind': 'bar',
+            'title': 'Distribuição por Grupos de Segmentação',
+            'xlabel': 'Grupos',
+            'ylabel': 'Quantidade de Usuários',
+            'labels': [str(group) for group in group_counts.index],
+            'series': [{'name': 'Usuários', 'values': group_counts.tolist(),
+                        'colors': [matplotlib.colors.to_hex(color) for color in colors]}],
+            'value_labels': True,
+        }
 
     # Renderiza o gráfico de colunas da segmentação
     @output
-    @render.plot
+    @chart_or_plot(segmentation_bar_chart, input.calculate_btn)
     def segmentation_bar_plot():
         """Gráfico de colunas da segmentação dos usuários RUP=True"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Segmentação dos Usuários Reais', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Segmentação dos Usuários Reais', 'Clique em "Calcular Gráficos" para visualizar os dados')
             
-            df_rup = calculate_rup()
-            df_rup = df_rup[df_rup['in_RUP'] == True].copy()
+            if not has_rup_users():
+                return empty_state_image('Segmentação dos Usuários RUP', 'Nenhum usuário RUP encontrado')
             
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Segmentação dos Usuários RUP', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
-            
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                # Converter first_seen para datetime se necessário e remover timezone
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            # Coorte RUP com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_rup_cohort()
             
             if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum dado disponível para os filtros selecionados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Segmentação dos Usuários RUP', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Segmentação dos Usuários RUP', 'Nenhum dado disponível para os filtros selecionados')
             
             # Obter parâmetros de segmentação
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
             
-            # Criar grupos baseados nas faixas personalizadas
-            df_rup['group'] = create_custom_groups(df_rup, var_name, num_groups)
-            
-            # Contar usuários por grupo e ordenar corretamente (Grupo 1 primeiro)
-            group_counts = df_rup['group'].value_counts()
-            
-            # Ordenar os grupos: Grupo 1, Grupo 2, etc.
-            group_order = sorted(group_counts.index, key=lambda x: int(x.split()[-1]) if isinstance(x, str) and ' ' in x else int(x))
-            group_counts = group_counts.reindex(group_order)
+            group_counts = segmentation_group_counts()
             
             # Criar cores da escala verde-vermelho (Grupo 1 = verde, Grupo N = vermelho)
             colors = plt.cm.RdYlGn_r(np.linspace(0, 1, len(group_counts)))
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            yield
             
-            fig, ax = plt.subplots(figsize=(3, 4))
+            fig, ax = figure_subplots(figsize=(3, 4))
             bars = ax.bar(range(len(group_counts)), group_counts.values, color=colors, alpha=0.8, edgecolor='white', linewidth=2)
             
             # Adicionar valores nas barras
@@ -1429,72 +2863,45 @@ def server(input, output, session):
             ax.spines['left'].set_color('#ccc')
             ax.spines['bottom'].set_color('#ccc')
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de barras: {e}")
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, f'Erro ao carregar gráfico: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro na Segmentação', fontsize=14, fontweight='bold')
-            return fig
+            return empty_state_image('Erro na Segmentação', f'Erro ao carregar gráfico: {str(e)}')
 
     # Renderiza o gráfico de linhas da segmentação
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def segmentation_line_plot():
         """Gráfico de linhas da evolução temporal dos grupos de segmentação"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Evolução Temporal dos Grupos', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Evolução Temporal dos Grupos', 'Clique em "Calcular Gráficos" para visualizar os dados')
             
-            df_rup = calculate_rup()
-            df_rup = df_rup[df_rup['in_RUP'] == True].copy()
+            if not has_rup_users():
+                return empty_state_image('Evolução Temporal dos Grupos', 'Nenhum usuário RUP encontrado')
             
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Evolução Temporal dos Grupos', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
-            
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                # Converter first_seen para datetime se necessário e remover timezone
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            # Coorte RUP com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_rup_cohort()
             
             if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum dado disponível para os filtros selecionados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Evolução Temporal dos Grupos', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Evolução Temporal dos Grupos', 'Nenhum dado disponível para os filtros selecionados')
             
             # Obter parâmetros de segmentação
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
             
-            # Criar grupos baseados nas faixas personalizadas
-            df_rup['group'] = create_custom_groups(df_rup, var_name, num_groups)
+            # Grupos das faixas personalizadas (etapa compartilhada de atribuição)
+            df_rup = segmented_rup_cohort()
             
-            # Converter first_seen para datetime e remover timezone
-            df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-            df_rup['month'] = df_rup['first_seen'].dt.to_period('M')
+            yield
             
-            # Agrupar por mês e grupo
-            monthly_counts = df_rup.groupby(['month', 'group'], observed=True).size().unstack(fill_value=0)
+            # Agrupar pelo código de mês pré-calculado e por grupo
+            df_rup = df_rup[df_rup['first_seen_month'] != MONTH_CODE_NA]
+            monthly_counts = df_rup.groupby(['first_seen_month', 'group'], observed=True).size().unstack(fill_value=0)
+            monthly_counts.index = month_codes_to_periods(monthly_counts.index)
             
             # Ordenar as colunas (Grupo 1 primeiro)
             group_order = sorted(monthly_counts.columns, key=lambda x: int(x.split()[-1]) if isinstance(x, str) and ' ' in x else int(x))
@@ -1503,11 +2910,7 @@ def server(input, output, session):
             # Criar cores da escala verde-vermelho (Grupo 1 = verde, Grupo N = vermelho)
             colors = plt.cm.RdYlGn_r(np.linspace(0, 1, len(monthly_counts.columns)))
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
-            
-            fig, ax = plt.subplots(figsize=(3, 4))
+            fig, ax = figure_subplots(figsize=(3, 4))
             
             for i, group in enumerate(monthly_counts.columns):
                 ax.plot(monthly_counts.index.astype(str), monthly_counts[group], 
@@ -1537,150 +2940,141 @@ def server(input, output, session):
             ax.spines['left'].set_color('#ccc')
             ax.spines['bottom'].set_color('#ccc')
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de linhas: {e}")
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, f'Erro ao carregar gráfico: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro na Segmentação', fontsize=14, fontweight='bold')
-        return fig
+            return empty_state_image('Erro na Segmentação', f'Erro ao carregar gráfico: {str(e)}')
+
+    # Matriz de interações dispositivo x grupo dos usuários RUP (colunas do Grupo 1 em diante),
+    # em proporções por grupo na escala proporcional; None se não houver interações.
+    # As entradas são lidas aqui; a função retornada calcula a matriz (também fora do loop)
+    def device_group_matrix(temporal):
+        df_rup = segmented_rup_cohort()
+        
+        # Somar interações por dispositivo e grupo a partir do cubo pré-agregado,
+        # já restrito aos usuários RUP, aos filtros cruzados e às X primeiras interações
+        selected_device_types, selected_event_classes = cross_filter_selection()
+        if temporal:
+            # Para evolução temporal, agrupar também por numero_interacao
+            by = ['user_agent_device_type', 'group', 'numero_interacao']
+        else:
+            # Agrupamento normal (total de interações)
+            by = ['user_agent_device_type', 'group']
+        interactions = cached_interactions(
+            'rup_cohort', df_rup['user_code'], by, first_n=input.first_interactions(),
+            device_types=selected_device_types, event_classes=selected_event_classes,
+            groups=df_rup['group'])
+        proportional = input.chart_scale() == "proportional"
+        
+        def matrix():
+            interaction_counts = interactions()
+            if interaction_counts.empty:
+                return None
+            
+            device_group_counts = interaction_counts.unstack(fill_value=0)
+            
+            # Ordenar as colunas (Grupo 1 primeiro)
+            group_order = sorted(device_group_counts.columns, key=lambda x: int(x.split()[-1]) if isinstance(x, str) and ' ' in x else int(x))
+            device_group_counts = device_group_counts[group_order]
+            
+            # Aplicar escala proporcional se selecionada
+            if proportional:
+                # Normalizar para proporções (0-1) por coluna (grupo)
+                device_group_counts = device_group_counts.div(device_group_counts.sum(axis=0), axis=1)
+            return device_group_counts
+        return matrix
+
+    def device_interactions_chart():
+        title = 'Interações por Tipo de Dispositivo'
+        if not input.calculate_btn():
+            return {'title': title, 'message': 'Clique em "Calcular Gráficos" para visualizar os dados'}
+        if not has_rup_users():
+            return {'title': title, 'message': 'Nenhum usuário RUP encontrado'}
+        device_group_counts = device_group_matrix(False)()
+        if device_group_counts is None:
+            return {'title': title, 'message': 'Nenhuma interação encontrada para os filtros selecionados'}
+        
+        # Adicionar informações de filtros no título
+        title = "Interações por Grupo de Usuário e Tipo de Dispositivo"
+        selected_device_types, selected_event_classes = cross_filter_selection()
+        filters = []
+        if selected_device_types:
+            filters.append(f"Dispositivos: {', '.join(selected_device_types)}")
+        if selected_event_classes:
+            filters.append(f"Eventos: {', '.join(selected_event_classes)}")
+        if filters:
+            title += f"\n(Filtrado: {' | '.join(filters)})"
+        
+        proportional = input.chart_scale() == "proportional"
+        chart = {
+            'kind': 'bar',
+            'stacked': True,
+            'title': title,
+            'xlabel': 'Grupo de Usuário',
+            'ylabel': 'Proporção' if proportional else 'Total de Interações',
+            'labels': [str(group) for group in device_group_counts.columns],
+            'series': [{'name': str(device_type), 'values': device_group_counts.loc[device_type].tolist(),
+                        'color': GLOBAL_COLORS.get(f'device_{device_type}', '#17becf')}
+                       for device_type in device_group_counts.index],
+        }
+        if proportional:
+            chart['ymax'] = 1
+        return chart
 
     # Renderiza o gráfico de interações por dispositivo
     @output
-    @render.plot
+    @chart_or_plot(device_interactions_chart, input.calculate_btn, input.segmentation_view)
     def device_interactions_plot():
         """Gráfico de barras empilhadas mostrando interações por tipo de dispositivo e grupo"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(8, 5))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Tipo de Dispositivo', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Interações por Tipo de Dispositivo', 'Clique em "Calcular Gráficos" para visualizar os dados')
             
             # Obter dados de segmentação
-            df_rup = calculate_rup()
-            df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Tipo de Dispositivo', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
+            if not has_rup_users():
+                return empty_state_image('Interações por Tipo de Dispositivo', 'Nenhum usuário RUP encontrado')
             
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            # Coorte RUP com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_rup_cohort()
             
             # Obter parâmetros de segmentação
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
             
-            # Criar grupos baseados nas faixas personalizadas
-            df_rup['group'] = create_custom_groups(df_rup, var_name, num_groups)
+            # Grupos das faixas personalizadas (etapa compartilhada de atribuição)
+            df_rup = segmented_rup_cohort()
             
             # Verificar se temos dados de interações
             if df_interactions.empty or 'unique_id' not in df_interactions.columns or 'user_agent_device_type' not in df_interactions.columns:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Dados de interações não disponíveis', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Tipo de Dispositivo', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Interações por Tipo de Dispositivo', 'Dados de interações não disponíveis')
             
             # Verificar se temos a coluna unique_id
             if 'unique_id' not in df_rup.columns:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Coluna unique_id não encontrada nos dados de usuários', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Tipo de Dispositivo', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Interações por Tipo de Dispositivo', 'Coluna unique_id não encontrada nos dados de usuários')
             
-            # Filtrar interações apenas para usuários RUP (otimização de memória)
-            unique_users_rup = set(df_rup['unique_id'].unique())
-            
-            # Aplicar filtros de forma mais eficiente
-            mask = df_interactions['unique_id'].isin(unique_users_rup)
+            selected_device_types, selected_event_classes = cross_filter_selection()
+            temporal_view = input.segmentation_view() == "temporal"
+            group_matrix = device_group_matrix(temporal_view)
+            chart_scale = input.chart_scale()
             
-            # Aplicar filtros cruzados se habilitados
+            # Filtros cruzados para o título
             if input.enable_cross_filters():
                 selected_device_types = input.filter_device_types()
-                if selected_device_types:
-                    mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
-                
                 selected_event_classes = input.filter_event_classes()
-                if selected_event_classes:
-                    mask &= df_interactions['event_classification'].isin(selected_event_classes)
-            
-            # Aplicar máscara de uma vez
-            df_interactions_filtered = df_interactions[mask].copy()
-            
-            # Aplicar filtro de X primeiras interações
-            first_interactions_count = input.first_interactions()
-            if first_interactions_count:
-                # Aplicar filtro por usuário (X primeiras interações de cada usuário)
-                df_interactions_filtered = df_interactions_filtered.groupby('unique_id').head(first_interactions_count)
-            
-            # Agrupar interações por usuário e tipo de dispositivo
-            if input.segmentation_view() == "temporal":
-                # Para evolução temporal, agrupar também por numero_interacao
-                if 'numero_interacao' in df_interactions_filtered.columns:
-                    df_interactions_grouped = df_interactions_filtered.groupby(['unique_id', 'user_agent_device_type', 'numero_interacao']).size().reset_index(name='interaction_count')
-                else:
-                    df_interactions_grouped = df_interactions_filtered.groupby(['unique_id', 'user_agent_device_type']).size().reset_index(name='interaction_count')
-            else:
-                # Agrupamento normal (total de interações)
-                df_interactions_grouped = df_interactions_filtered.groupby(['unique_id', 'user_agent_device_type']).size().reset_index(name='interaction_count')
-            
-            # Limpar memória
-            del df_interactions_filtered
-            gc.collect()
-            
-            df_merged = df_rup.merge(df_interactions_grouped, on='unique_id', how='inner')
-            
-            if df_merged.empty:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada para os filtros selecionados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Tipo de Dispositivo', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Somar interações por dispositivo e grupo
-            if input.segmentation_view() == "temporal" and 'numero_interacao' in df_merged.columns:
-                # Para evolução temporal, agrupar por dispositivo, grupo e numero_interacao
-                device_group_counts = df_merged.groupby(['user_agent_device_type', 'group', 'numero_interacao'])['interaction_count'].sum().unstack(fill_value=0)
-            else:
-                # Agrupamento normal (total de interações)
-                device_group_counts = df_merged.groupby(['user_agent_device_type', 'group'])['interaction_count'].sum().unstack(fill_value=0)
-            
-            # Limpar memória
-            del df_merged
-            del df_interactions_grouped
-            gc.collect()
+                filters = []
             
-            # Ordenar as colunas (Grupo 1 primeiro)
-            group_order = sorted(device_group_counts.columns, key=lambda x: int(x.split()[-1]) if isinstance(x, str) and ' ' in x else int(x))
-            device_group_counts = device_group_counts[group_order]
+            yield
             
-            # Aplicar escala proporcional se selecionada
-            chart_scale = input.chart_scale()
-            if chart_scale == "proportional":
-                # Normalizar para proporções (0-1) por coluna (grupo)
-                device_group_counts = device_group_counts.div(device_group_counts.sum(axis=0), axis=1)
+            device_group_counts = group_matrix()
+            if device_group_counts is None:
+                return empty_state_image('Interações por Tipo de Dispositivo', 'Nenhuma interação encontrada para os filtros selecionados')
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            group_order = list(device_group_counts.columns)
             
-            fig, ax = plt.subplots(figsize=(8, 5))
+            fig, ax = figure_subplots(figsize=(8, 5))
             
             # Usar cores padronizadas para dispositivos (valores reais)
             device_colors = {
@@ -1692,7 +3086,7 @@ def server(input, output, session):
             }
             
             # Verificar se deve mostrar evolução temporal
-            if input.segmentation_view() == "temporal" and 'numero_interacao' in device_group_counts.columns:
+            if temporal_view and 'numero_interacao' in device_group_counts.columns:
                 # Gráfico de evolução temporal (linhas)
                 for group in group_order:
                     if group in device_group_counts.columns:
@@ -1731,10 +3125,6 @@ def server(input, output, session):
                 
                 # Adicionar informações de filtros no título
                 title = "Interações por Grupo de Usuário e Tipo de Dispositivo"
-                if input.enable_cross_filters():
-                    selected_device_types = input.filter_device_types()
-                    selected_event_classes = input.filter_event_classes()
-                    filters = []
                 if selected_device_types:
                     filters.append(f"Dispositivos: {', '.join(selected_device_types)}")
                 if selected_event_classes:
@@ -1764,111 +3154,63 @@ def server(input, output, session):
             ax.spines['top'].set_visible(False)
             ax.spines['right'].set_visible(False)
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de interações por dispositivo: {e}")
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.text(0.5, 0.5, f'Erro ao carregar gráfico: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro na Análise de Dispositivos', fontsize=14, fontweight='bold')
-        return fig
+            return empty_state_image('Erro na Análise de Dispositivos', f'Erro ao carregar gráfico: {str(e)}')
 
     # Renderiza o gráfico de interações por classificação de evento (modo agrupado)
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn, input.segmentation_view)
     def event_classification_plot():
         """Gráfico de barras empilhadas mostrando interações por classificação de evento e grupo"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(8, 5))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Classificação de Evento', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Interações por Classificação de Evento', 'Clique em "Calcular Gráficos" para visualizar os dados')
             
             # Obter dados de segmentação
-            df_rup = calculate_rup()
-            df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Classificação de Evento', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
+            if not has_rup_users():
+                return empty_state_image('Interações por Classificação de Evento', 'Nenhum usuário RUP encontrado')
             
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
-            
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            # Coorte RUP com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_rup_cohort()
             
             # Obter parâmetros de segmentação
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
             
-            # Criar grupos baseados nas faixas personalizadas
-            df_rup['group'] = create_custom_groups(df_rup, var_name, num_groups)
-            
-            # Filtrar interações apenas para usuários RUP
-            unique_users_rup = set(df_rup['unique_id'].unique())
-            mask = df_interactions['unique_id'].isin(unique_users_rup)
+            # Grupos das faixas personalizadas (etapa compartilhada de atribuição)
+            df_rup = segmented_rup_cohort()
             
-            # Aplicar filtros cruzados se habilitados
-            if input.enable_cross_filters():
-                selected_device_types = input.filter_device_types()
-                if selected_device_types:
-                    mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
-                
-                selected_event_classes = input.filter_event_classes()
-                if selected_event_classes:
-                    mask &= df_interactions['event_classification'].isin(selected_event_classes)
-            
-            # Aplicar filtro de X primeiras interações
-            first_interactions_count = input.first_interactions()
-            if first_interactions_count:
-                df_interactions_filtered = df_interactions[mask].copy()
-                df_interactions_filtered = df_interactions_filtered.groupby('unique_id').head(first_interactions_count)
-            else:
-                df_interactions_filtered = df_interactions[mask].copy()
-            
-            # Agrupar interações por usuário e classificação de evento
-            df_interactions_grouped = df_interactions_filtered.groupby(['unique_id', 'event_classification']).size().reset_index(name='interaction_count')
+            # Somar interações por classificação de evento e grupo a partir do cubo pré-agregado,
+            # já restrito aos usuários RUP, aos filtros cruzados e às X primeiras interações
+            selected_device_types, selected_event_classes = cross_filter_selection()
+            interactions = cached_interactions(
+                'rup_cohort', df_rup['user_code'], ['event_classification', 'group'], first_n=input.first_interactions(),
+                device_types=selected_device_types, event_classes=selected_event_classes,
+                groups=df_rup['group'])
+            chart_scale = input.chart_scale()
             
-            # Fazer merge com dados de usuários
-            df_merged = df_rup.merge(df_interactions_grouped, on='unique_id', how='inner')
+            yield
             
-            if df_merged.empty:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada para os filtros selecionados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Classificação de Evento', fontsize=14, fontweight='bold')
-                return fig
+            interaction_counts = interactions()
+            if interaction_counts.empty:
+                return empty_state_image('Interações por Classificação de Evento', 'Nenhuma interação encontrada para os filtros selecionados')
             
-            # Somar interações por classificação de evento e grupo
-            event_group_counts = df_merged.groupby(['event_classification', 'group'])['interaction_count'].sum().unstack(fill_value=0)
+            event_group_counts = interaction_counts.unstack(fill_value=0)
             
             # Ordenar as colunas (Grupo 1 primeiro)
             group_order = sorted(event_group_counts.columns, key=lambda x: int(x.split()[-1]) if isinstance(x, str) and ' ' in x else int(x))
             event_group_counts = event_group_counts[group_order]
             
             # Aplicar escala proporcional se selecionada
-            chart_scale = input.chart_scale()
             if chart_scale == "proportional":
                 event_group_counts = event_group_counts.div(event_group_counts.sum(axis=0), axis=1)
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
-            
-            fig, ax = plt.subplots(figsize=(8, 5))
+            fig, ax = figure_subplots(figsize=(8, 5))
             
             # Usar cores padronizadas para eventos
             event_colors = {
@@ -1912,160 +3254,12 @@ def server(input, output, session):
             ax.spines['top'].set_visible(False)
             ax.spines['right'].set_visible(False)
             
-            plt.tight_layout()
-            return fig
-            
-        except Exception as e:
-            print(f"Erro no gráfico de classificação de eventos: {e}")
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.text(0.5, 0.5, f'Erro ao carregar gráfico: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro na Classificação de Eventos', fontsize=14, fontweight='bold')
-            return fig
-            
-            # Limpar memória
-            del df_interactions_filtered
-            gc.collect()
-            
-            df_merged = df_rup.merge(df_interactions_grouped, on='unique_id', how='inner')
-            
-            if df_merged.empty:
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada para os filtros selecionados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Interações por Classificação de Evento', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Somar interações por classificação de evento e grupo
-            if input.segmentation_view() == "temporal" and 'numero_interacao' in df_merged.columns:
-                # Para evolução temporal, agrupar por classificação, grupo e numero_interacao
-                event_group_counts = df_merged.groupby(['event_classification', 'group', 'numero_interacao'])['interaction_count'].sum().unstack(fill_value=0)
-            else:
-                # Agrupamento normal (total de interações)
-                event_group_counts = df_merged.groupby(['event_classification', 'group'])['interaction_count'].sum().unstack(fill_value=0)
-            
-            # Limpar memória
-            del df_merged
-            del df_interactions_grouped
-            gc.collect()
-            
-            # Ordenar as colunas (Grupo 1 primeiro)
-            if input.segmentation_view() == "temporal" and 'numero_interacao' in event_group_counts.columns:
-                # Para evolução temporal, as colunas são números de interação
-                group_order = sorted(event_group_counts.columns)
-            else:
-                # Para modo normal, as colunas são grupos
-                group_order = sorted(event_group_counts.columns, key=lambda x: int(x.split()[-1]) if isinstance(x, str) and ' ' in x else int(x))
-            event_group_counts = event_group_counts[group_order]
-            
-            # Aplicar escala proporcional se selecionada
-            chart_scale = input.chart_scale()
-            if chart_scale == "proportional":
-                # Normalizar para proporções (0-1) por coluna (grupo)
-                event_group_counts = event_group_counts.div(event_group_counts.sum(axis=0), axis=1)
-            
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
-            
-            fig, ax = plt.subplots(figsize=(8, 5))
-            
-            # Usar cores padronizadas para eventos (valores reais)
-            event_colors = {
-                'Criação e Edição': GLOBAL_COLORS['event_Criação e Edição'],
-                'Engajamento Social': GLOBAL_COLORS['event_Engajamento Social'],
-                'Exportação e Download': GLOBAL_COLORS['event_Exportação e Download'],
-                'Mari IA': GLOBAL_COLORS['event_Mari IA'],
-                'Visualização e Acesso': GLOBAL_COLORS['event_Visualização e Acesso'],
-                'Não Especificado': GLOBAL_COLORS['event_Não Especificado']
-            }
-            
-            # Verificar se deve mostrar evolução temporal
-            if input.segmentation_view() == "temporal" and 'numero_interacao' in event_group_counts.columns:
-                # Gráfico de evolução temporal (linhas)
-                for group in group_order:
-                    if group in event_group_counts.columns:
-                        group_data = event_group_counts[group]
-                        for event_class in group_data.index:
-                            if event_class in event_colors:
-                                values = group_data.loc[event_class].values
-                                days = group_data.columns
-                                ax.plot(days, values, marker='o', linewidth=2, markersize=4,
-                                       label=f"{event_class} - {group}", color=event_colors[event_class], alpha=0.8)
-                
-                ax.set_xlabel('Dia de Interação', fontsize=10)
-                ax.set_ylabel('Número de Interações', fontsize=10)
-                ax.set_title('Evolução Temporal - Classificação de Evento', fontsize=14, fontweight='bold')
-                ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-                ax.grid(True, alpha=0.3)
-                
-            else:
-                # Gráfico de barras empilhadas (modo normal)
-                bottom = np.zeros(len(event_group_counts.columns))
-                bars = []
-                
-                # Garantir que temos dados para plotar
-                if not event_group_counts.empty:
-                    for i, event_class in enumerate(event_group_counts.index):
-                        event_data = event_group_counts.loc[event_class]
-                        color = event_colors.get(event_class, f'C{i}')  # Usar cor do matplotlib se não encontrar
-                        
-                        # Verificar se há dados para este evento
-                        if event_data.sum() > 0:
-                            # Usar índices numéricos para evitar problemas de alinhamento
-                            x_positions = range(len(event_group_counts.columns))
-                            bars.append(ax.bar(x_positions, event_data, 
-                                              bottom=bottom, color=color, alpha=0.8, 
-                                              edgecolor='white', linewidth=1, label=event_class))
-                            bottom += event_data
-                
-                # Estilizar o gráfico
-                scale_label = "Proporção" if chart_scale == "proportional" else "Total de Interações"
-            
-            # Adicionar informações de filtros no título
-            title = "Interações por Grupo de Usuário e Classificação de Evento"
-            if input.enable_cross_filters():
-                selected_device_types = input.filter_device_types()
-                selected_event_classes = input.filter_event_classes()
-                filters = []
-                if selected_device_types:
-                    filters.append(f"Dispositivos: {', '.join(selected_device_types)}")
-                if selected_event_classes:
-                    filters.append(f"Eventos: {', '.join(selected_event_classes)}")
-                if filters:
-                    title += f"\n(Filtrado: {' | '.join(filters)})"
-            
-            ax.set_title(title, fontsize=16, fontweight='600', color='#8A2BE2', pad=20)
-            ax.set_ylabel(scale_label, fontsize=12, fontweight='500', color='#333')
-            ax.set_xlabel("Grupo de Usuário", fontsize=12, fontweight='500', color='#333')
-            
-            # Configurar eixo X com labels corretos
-            ax.set_xticks(range(len(event_group_counts.columns)))
-            ax.set_xticklabels(event_group_counts.columns)
-            ax.tick_params(axis='x', rotation=0)
-            
-            # Adicionar legenda
-            ax.legend(loc='upper right', fontsize=10, title='Classificação de Evento')
-            
-            # Personalizar o eixo Y
-            if chart_scale == "proportional":
-                ax.set_ylim(0, 1)
-            else:
-                ax.set_ylim(0, None)
-            
-            ax.grid(True, alpha=0.3, axis='y')
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['left'].set_color('#ccc')
-            ax.spines['bottom'].set_color('#ccc')
-            
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de classificação de eventos: {e}")
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.text(0.5, 0.5, f'Erro ao carregar gráfico: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro na Análise de Classificação de Eventos', fontsize=14, fontweight='bold')
-        return fig
+            return empty_state_image('Erro na Classificação de Eventos', f'Erro ao carregar gráfico: {str(e)}')
 
     # Função auxiliar para obter dados de trajetória de um usuário específico
     def get_user_trajectory_data(user_id, group_name):
@@ -2074,33 +3268,24 @@ def server(input, output, session):
             if df_interactions.empty or 'unique_id' not in df_interactions.columns:
                 return None, None
             
-            # Filtrar interações do usuário específico de forma mais eficiente
-            mask = df_interactions['unique_id'] == user_id
+            # Fatia do índice por usuário, já limitada às X primeiras interações
+            first_interactions_count = input.first_interactions()
+            user_interactions = user_interaction_rows(user_id, first_interactions_count)
             
             # Aplicar filtros cruzados se habilitados
             if input.enable_cross_filters():
                 selected_device_types = input.filter_device_types()
                 if selected_device_types:
-                    mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
+                    user_interactions = user_interactions[user_interactions['user_agent_device_type'].isin(selected_device_types)]
                 
                 selected_event_classes = input.filter_event_classes()
                 if selected_event_classes:
-                    mask &= df_interactions['event_classification'].isin(selected_event_classes)
-            
-            # Aplicar filtro de X primeiras interações (primeiros X dias)
-            first_interactions_count = input.first_interactions()
-            if first_interactions_count and 'numero_interacao' in df_interactions.columns:
-                mask &= df_interactions['numero_interacao'] <= first_interactions_count
-            
-            # Aplicar máscara de uma vez
-            user_interactions = df_interactions[mask].copy()
+                    user_interactions = user_interactions[user_interactions['event_classification'].isin(selected_event_classes)]
             
             if user_interactions.empty:
                 return None, None
             
-            # Aplicar fallback se numero_interacao não existir
-            if first_interactions_count and 'numero_interacao' not in df_interactions.columns and first_interactions_count < len(user_interactions):
-                user_interactions = user_interactions.head(first_interactions_count)
+            user_interactions = user_interactions.copy()
             
             # Usar numero_interacao para agrupamento temporal
             if 'numero_interacao' in user_interactions.columns:
@@ -2118,10 +3303,10 @@ def server(input, output, session):
                     user_interactions['day'] = pd.to_datetime('2024-01-01').date()
             
             # Agrupar por dia e tipo de dispositivo
-            device_data = user_interactions.groupby(['day', 'user_agent_device_type']).size().unstack(fill_value=0)
+            device_data = user_interactions.groupby(['day', 'user_agent_device_type'], observed=True).size().unstack(fill_value=0)
             
             # Agrupar por dia e classificação de evento
-            event_data = user_interactions.groupby(['day', 'event_classification']).size().unstack(fill_value=0)
+            event_data = user_interactions.groupby(['day', 'event_classification'], observed=True).size().unstack(fill_value=0)
             
             return device_data, event_data
             
@@ -2132,24 +3317,18 @@ def server(input, output, session):
 
     # Gráfico de trajetória - Grupo 1 + Tipo de Dispositivo
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def trajectory_g1_device():
         """Gráfico de trajetória temporal do melhor usuário por tipo de dispositivo"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 1 - Tipo de Dispositivo', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 1 - Tipo de Dispositivo', 'Clique em "Calcular Gráficos" para visualizar os dados', fontsize=12)
             
             best_user, worst_user, var_name = get_extreme_users()
             
             if best_user is None:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 1 - Tipo de Dispositivo', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 1 - Tipo de Dispositivo', 'Nenhum usuário encontrado', fontsize=12)
             
             best_id = best_user.get('unique_id', best_user.get('uid', 'N/A'))
             worst_id = worst_user.get('unique_id', worst_user.get('uid', 'N/A'))
@@ -2157,16 +3336,11 @@ def server(input, output, session):
             device_data, _ = get_user_trajectory_data(best_id, 'Melhor Usuário')
             
             if device_data is None or device_data.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 1 - Tipo de Dispositivo', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 1 - Tipo de Dispositivo', 'Nenhuma interação encontrada', fontsize=12)
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            yield
             
-            fig, ax = plt.subplots(figsize=(3, 4))
+            fig, ax = figure_subplots(figsize=(3, 4))
             
             # Usar cores padronizadas para dispositivos (valores reais)
             device_colors = {
@@ -2209,36 +3383,27 @@ def server(input, output, session):
             ax.spines['top'].set_visible(False)
             ax.spines['right'].set_visible(False)
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de trajetória G1 device: {e}")
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro - Grupo 1 Device', fontsize=12, fontweight='bold')
-            return fig
+            return empty_state_image('Erro - Grupo 1 Device', f'Erro: {str(e)}', fontsize=12)
 
     # Gráfico de trajetória - Grupo 2 + Tipo de Dispositivo
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def trajectory_g2_device():
         """Gráfico de trajetória temporal do pior usuário por tipo de dispositivo"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 2 - Tipo de Dispositivo', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 2 - Tipo de Dispositivo', 'Clique em "Calcular Gráficos" para visualizar os dados', fontsize=12)
             
             best_user, worst_user, var_name = get_extreme_users()
             
             if worst_user is None:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 2 - Tipo de Dispositivo', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 2 - Tipo de Dispositivo', 'Nenhum usuário encontrado', fontsize=12)
             
             worst_id = worst_user.get('unique_id', worst_user.get('uid', 'N/A'))
             best_id = best_user.get('unique_id', best_user.get('uid', 'N/A'))
@@ -2246,16 +3411,11 @@ def server(input, output, session):
             device_data, _ = get_user_trajectory_data(worst_id, 'Pior Usuário')
             
             if device_data is None or device_data.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 2 - Tipo de Dispositivo', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 2 - Tipo de Dispositivo', 'Nenhuma interação encontrada', fontsize=12)
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            yield
             
-            fig, ax = plt.subplots(figsize=(3, 4))
+            fig, ax = figure_subplots(figsize=(3, 4))
             
             # Usar cores padronizadas para dispositivos (valores reais)
             device_colors = {
@@ -2298,36 +3458,27 @@ def server(input, output, session):
             ax.spines['top'].set_visible(False)
             ax.spines['right'].set_visible(False)
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de trajetória G2 device: {e}")
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro - Grupo 2 Device', fontsize=12, fontweight='bold')
-            return fig
+            return empty_state_image('Erro - Grupo 2 Device', f'Erro: {str(e)}', fontsize=12)
 
     # Gráfico de trajetória - Grupo 1 + Classificação de Evento
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def trajectory_g1_event():
         """Gráfico de trajetória temporal do melhor usuário por classificação de evento"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 1 - Classificação de Evento', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 1 - Classificação de Evento', 'Clique em "Calcular Gráficos" para visualizar os dados', fontsize=12)
             
             best_user, worst_user, var_name = get_extreme_users()
             
             if best_user is None:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 1 - Classificação de Evento', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 1 - Classificação de Evento', 'Nenhum usuário encontrado', fontsize=12)
             
             best_id = best_user.get('unique_id', best_user.get('uid', 'N/A'))
             worst_id = worst_user.get('unique_id', worst_user.get('uid', 'N/A'))
@@ -2335,16 +3486,11 @@ def server(input, output, session):
             _, event_data = get_user_trajectory_data(best_id, 'Melhor Usuário')
             
             if event_data is None or event_data.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 1 - Classificação de Evento', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 1 - Classificação de Evento', 'Nenhuma interação encontrada', fontsize=12)
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            yield
             
-            fig, ax = plt.subplots(figsize=(3, 4))
+            fig, ax = figure_subplots(figsize=(3, 4))
             
             # Usar cores padronizadas para eventos (valores reais)
             event_colors = {
@@ -2388,36 +3534,27 @@ def server(input, output, session):
             ax.spines['top'].set_visible(False)
             ax.spines['right'].set_visible(False)
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de trajetória G1 event: {e}")
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro - Grupo 1 Event', fontsize=12, fontweight='bold')
-            return fig
+            return empty_state_image('Erro - Grupo 1 Event', f'Erro: {str(e)}', fontsize=12)
 
     # Gráfico de trajetória - Grupo 2 + Classificação de Evento
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def trajectory_g2_event():
         """Gráfico de trajetória temporal do pior usuário por classificação de evento"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 2 - Classificação de Evento', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 2 - Classificação de Evento', 'Clique em "Calcular Gráficos" para visualizar os dados', fontsize=12)
             
             best_user, worst_user, var_name = get_extreme_users()
             
             if worst_user is None:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 2 - Classificação de Evento', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 2 - Classificação de Evento', 'Nenhum usuário encontrado', fontsize=12)
             
             worst_id = worst_user.get('unique_id', worst_user.get('uid', 'N/A'))
             best_id = best_user.get('unique_id', best_user.get('uid', 'N/A'))
@@ -2425,16 +3562,11 @@ def server(input, output, session):
             _, event_data = get_user_trajectory_data(worst_id, 'Pior Usuário')
             
             if event_data is None or event_data.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Grupo 2 - Classificação de Evento', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Grupo 2 - Classificação de Evento', 'Nenhuma interação encontrada', fontsize=12)
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            yield
             
-            fig, ax = plt.subplots(figsize=(3, 4))
+            fig, ax = figure_subplots(figsize=(3, 4))
             
             # Usar cores padronizadas para eventos (valores reais)
             event_colors = {
@@ -2478,39 +3610,30 @@ def server(input, output, session):
             ax.spines['top'].set_visible(False)
             ax.spines['right'].set_visible(False)
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de trajetória G2 event: {e}")
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Erro - Grupo 2 Event', fontsize=12, fontweight='bold')
-        return fig
+            return empty_state_image('Erro - Grupo 2 Event', f'Erro: {str(e)}', fontsize=12)
 
     # ======================================================================================
     # GRÁFICO COMBINADO DE TRAJETÓRIAS INDIVIDUAIS (2x2)
     # ======================================================================================
 
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def trajectory_combined_plot():
         """Gráfico combinado de trajetórias individuais - 2x2 (melhor/pior usuário)"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(12, 8))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Trajetórias Individuais', fontsize=16, fontweight='bold')
-                return fig
+                return empty_state_image('Trajetórias Individuais', 'Clique em "Calcular Gráficos" para visualizar os dados', fontsize=16)
             
             best_user, worst_user, var_name = get_extreme_users()
             
             if best_user is None or worst_user is None:
-                fig, ax = plt.subplots(figsize=(12, 8))
-                ax.text(0.5, 0.5, 'Nenhum usuário encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Trajetórias Individuais', fontsize=16, fontweight='bold')
-                return fig
+                return empty_state_image('Trajetórias Individuais', 'Nenhum usuário encontrado', fontsize=16)
             
             best_id = best_user.get('unique_id', best_user.get('uid', 'N/A'))
             worst_id = worst_user.get('unique_id', worst_user.get('uid', 'N/A'))
@@ -2519,14 +3642,11 @@ def server(input, output, session):
             best_device_data, best_event_data = get_user_trajectory_data(best_id, 'Melhor Usuário')
             worst_device_data, worst_event_data = get_user_trajectory_data(worst_id, 'Pior Usuário')
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            yield
             
-            # Criar 2 figuras separadas: uma para melhor usuário e uma para pior usuário
-            # Cada figura terá 2 gráficos: eventos e dispositivos
-            fig1, axes1 = plt.subplots(nrows=1, ncols=2, figsize=(12, 5))  # Melhor usuário
-            fig2, axes2 = plt.subplots(nrows=1, ncols=2, figsize=(12, 5))  # Pior usuário
+            # Uma única figura 2x2: melhor usuário na primeira linha e pior usuário na segunda,
+            # cada linha com 2 gráficos (eventos e dispositivos)
+            fig, (axes1, axes2) = figure_subplots(nrows=2, ncols=2, figsize=(12, 10))
             
             # Cores padronizadas
             event_colors = {
@@ -2717,39 +3837,27 @@ def server(input, output, session):
                         ax.set_xticks(range(1, max_days + 1))
                         ax.set_xticklabels(range(1, max_days + 1))
             
-            # Ajustar layout das duas figuras
-            plt.tight_layout()
-            
-            # Retornar as duas figuras como uma lista
-            return [fig1, fig2]
+            fig.tight_layout()
+            return fig
             
         except Exception as e:
             print(f"Erro no gráfico combinado de trajetórias: {e}")
-            fig, ax = plt.subplots(figsize=(12, 8))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Trajetórias Individuais', fontsize=16, fontweight='bold')
-            return [fig, fig]
+            return empty_state_image('Trajetórias Individuais', f'Erro: {str(e)}', fontsize=16)
 
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def trajectory_best_plot():
         """Gráfico de trajetórias do melhor usuário"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(12, 5))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Melhor Usuário - Trajetórias', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Melhor Usuário - Trajetórias', 'Clique em "Calcular Gráficos" para visualizar os dados')
             
             # Obter usuários extremos
             best_user, worst_user, var_name = get_extreme_users()
             
             if best_user is None or worst_user is None:
-                fig, ax = plt.subplots(figsize=(12, 5))
-                ax.text(0.5, 0.5, 'Nenhum usuário encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Melhor Usuário - Trajetórias', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Melhor Usuário - Trajetórias', 'Nenhum usuário encontrado')
             
             best_id = best_user.get('unique_id', best_user.get('uid', 'N/A'))
             worst_id = worst_user.get('unique_id', worst_user.get('uid', 'N/A'))
@@ -2763,12 +3871,10 @@ def server(input, output, session):
             print(f"DEBUG: Pior usuário - Eventos: {worst_event_data.columns.tolist() if worst_event_data is not None else 'None'}")
             print(f"DEBUG: Pior usuário - Dispositivos: {worst_device_data.columns.tolist() if worst_device_data is not None else 'None'}")
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            yield
             
             # Criar figura com 2x2 subplots (classificação na primeira linha, dispositivos na segunda)
-            fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(12, 8))
+            fig, axes = figure_subplots(nrows=2, ncols=2, figsize=(12, 8))
             
             # Adicionar títulos de coluna centralizados
             fig.text(0.25, 0.95, f"Melhor Usuário (ID: {best_id})", ha='center', va='top', fontsize=14, fontweight='bold', color='#8A2BE2')
@@ -2967,15 +4073,12 @@ def server(input, output, session):
                     ax.set_xticklabels(range(1, max_days + 1))
                     ax.set_xlim(0.5, max_days + 0.5)
             
-            plt.tight_layout(rect=[0, 0, 1, 0.85])  # Deixar mais espaço para os títulos de coluna
+            fig.tight_layout(rect=[0, 0, 1, 0.85])  # Deixar mais espaço para os títulos de coluna
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico do melhor usuário: {e}")
-            fig, ax = plt.subplots(figsize=(12, 5))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Melhor Usuário - Trajetórias', fontsize=14, fontweight='bold')
-            return fig
+            return empty_state_image('Melhor Usuário - Trajetórias', f'Erro: {str(e)}')
 
 
     # ======================================================================================
@@ -2983,59 +4086,48 @@ def server(input, output, session):
     # ======================================================================================
 
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def seg_event_temporal_plot():
         """Gráfico de evolução temporal - Classificação de Evento - Todos os Grupos"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Evolução Temporal', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Classificação de Evento - Evolução Temporal', 'Clique em "Calcular Gráficos" para visualizar os dados')
             
             # Obter dados de segmentação
-            df_rup = calculate_rup()
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Evolução Temporal', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
+            if df_users.empty:
+                return empty_state_image('Classificação de Evento - Evolução Temporal', 'Nenhum usuário RUP encontrado')
             
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            # Coorte com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_cohort()
             
             if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.text(0.5, 0.5, 'Nenhum dado após filtros temporais', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Evolução Temporal', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Classificação de Evento - Evolução Temporal', 'Nenhum dado após filtros temporais')
             
-            # Criar grupos baseados nas faixas personalizadas
+            # Grupos das faixas personalizadas (etapa compartilhada de atribuição)
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
-            df_rup['group'] = create_custom_groups(df_rup, var_name, num_groups)
+            df_rup = segmented_cohort()
             
             # Obter grupos únicos
             unique_groups = sorted(df_rup['group'].unique())
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            # Aplicar escala proporcional se selecionada
+            chart_scale = input.chart_scale()
+            y_axis_max = input.y_axis_max()
+            
+            # Interações por grupo, classificação de evento e numero_interacao, somadas uma única vez a partir
+            # do cubo pré-agregado (filtros cruzados e X primeiras interações já aplicados)
+            selected_device_types, selected_event_classes = cross_filter_selection()
+            interactions = cached_interactions(
+                'cohort', df_rup['user_code'], ['group', 'event_classification', 'numero_interacao'],
+                first_n=input.first_interactions(), device_types=selected_device_types,
+                event_classes=selected_event_classes, groups=df_rup['group'])
+            
+            yield
             
             # Criar subplots com mais largura e menos distanciamento
-            fig, axes = plt.subplots(nrows=1, ncols=len(unique_groups), figsize=(4*len(unique_groups), 4))
+            fig, axes = figure_subplots(nrows=1, ncols=len(unique_groups), figsize=(4*len(unique_groups), 4))
             if len(unique_groups) == 1:
                 axes = [axes]
             
@@ -3049,8 +4141,11 @@ def server(input, output, session):
                 'Não Especificado': GLOBAL_COLORS['event_Não Especificado']
             }
             
-            # Aplicar escala proporcional se selecionada
-            chart_scale = input.chart_scale()
+            interaction_counts = interactions()
+            group_interactions = {
+                group: counts.droplevel('group').reset_index()
+                for group, counts in interaction_counts.groupby(level='group')
+            }
             
             # Primeiro, calcular valores máximos para padronizar escalas
             max_y_value = 0
@@ -3058,33 +4153,14 @@ def server(input, output, session):
             all_event_classes = set()
             
             for group in unique_groups:
-                df_group = df_rup[df_rup['group'] == group].copy()
+                df_group = df_rup[df_rup['group'] == group]
                 if df_group.empty:
                     continue
                 
-                # Filtrar interações para usuários do grupo
-                unique_users_group = set(df_group['unique_id'].unique())
-                mask = df_interactions['unique_id'].isin(unique_users_group)
-                
-                # Aplicar filtros cruzados se habilitados
-                if input.enable_cross_filters():
-                    selected_device_types = input.filter_device_types()
-                    if selected_device_types:
-                        mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
-                    
-                    selected_event_classes = input.filter_event_classes()
-                    if selected_event_classes:
-                        mask &= df_interactions['event_classification'].isin(selected_event_classes)
-                
-                # Aplicar filtro de X primeiras interações
-                first_interactions_count = input.first_interactions()
-                if 'numero_interacao' in df_interactions.columns:
-                    mask &= df_interactions['numero_interacao'] <= first_interactions_count
+                # Interações do grupo já agregadas por classificação de evento e numero_interacao
+                df_grouped = group_interactions.get(group)
                 
-                df_interactions_filtered = df_interactions[mask].copy()
-                
-                if not df_interactions_filtered.empty and 'numero_interacao' in df_interactions_filtered.columns:
-                    df_grouped = df_interactions_filtered.groupby(['event_classification', 'numero_interacao']).size().reset_index(name='interaction_count')
+                if df_grouped is not None:
                     df_pivot = df_grouped.pivot(index='numero_interacao', columns='event_classification', values='interaction_count').fillna(0)
                     
                     # Aplicar escala proporcional se selecionada
@@ -3101,41 +4177,22 @@ def server(input, output, session):
                 ax = axes[i]
                 
                 # Filtrar usuários do grupo atual
-                df_group = df_rup[df_rup['group'] == group].copy()
+                df_group = df_rup[df_rup['group'] == group]
                 if df_group.empty:
                     ax.text(0.5, 0.5, f'Nenhum usuário do {group}', ha='center', va='center', transform=ax.transAxes)
                     ax.set_title(f'{group}', fontsize=12, fontweight='bold', color='#8A2BE2')
                     continue
                 
-                # Filtrar interações para usuários do grupo
-                unique_users_group = set(df_group['unique_id'].unique())
-                mask = df_interactions['unique_id'].isin(unique_users_group)
-                
-                # Aplicar filtros cruzados se habilitados
-                if input.enable_cross_filters():
-                    selected_device_types = input.filter_device_types()
-                    if selected_device_types:
-                        mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
-                    
-                    selected_event_classes = input.filter_event_classes()
-                    if selected_event_classes:
-                        mask &= df_interactions['event_classification'].isin(selected_event_classes)
-                
-                # Aplicar filtro de X primeiras interações
-                first_interactions_count = input.first_interactions()
-                if 'numero_interacao' in df_interactions.columns:
-                    mask &= df_interactions['numero_interacao'] <= first_interactions_count
+                # Interações do grupo já agregadas (cubo pré-agregado)
+                df_grouped = group_interactions.get(group)
                 
-                df_interactions_filtered = df_interactions[mask].copy()
-                
-                if df_interactions_filtered.empty:
+                if df_grouped is None:
                     ax.text(0.5, 0.5, 'Nenhuma interação encontrada', ha='center', va='center', transform=ax.transAxes)
                     ax.set_title(f'{group}', fontsize=12, fontweight='bold', color='#8A2BE2')
                     continue
                 
                 # Agrupar por classificação de evento e numero_interacao
-                if 'numero_interacao' in df_interactions_filtered.columns:
-                    df_grouped = df_interactions_filtered.groupby(['event_classification', 'numero_interacao']).size().reset_index(name='interaction_count')
+                if 'numero_interacao' in df_grouped.columns:
                     df_pivot = df_grouped.pivot(index='numero_interacao', columns='event_classification', values='interaction_count').fillna(0)
                     
                     # Aplicar escala proporcional se selecionada
@@ -3171,7 +4228,7 @@ def server(input, output, session):
                     if chart_scale == "proportional":
                         ax.set_ylim(0, 1)
                     else:
-                        y_max = input.y_axis_max() if input.y_axis_max() else max_y_value * 1.1
+                        y_max = y_axis_max if y_axis_max else max_y_value * 1.1
                         ax.set_ylim(0, y_max)
                     if max_x_value > 0:
                         ax.set_xlim(0, max_x_value + 1)
@@ -3183,118 +4240,59 @@ def server(input, output, session):
                     ax.text(0.5, 0.5, 'Coluna numero_interacao não encontrada', ha='center', va='center', transform=ax.transAxes)
                     ax.set_title(f'{group}', fontsize=12, fontweight='bold', color='#8A2BE2')
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de classificação de eventos temporal: {e}")
-            fig, ax = plt.subplots(figsize=(10, 4))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Classificação de Evento - Evolução Temporal', fontsize=14, fontweight='bold')
-            return fig
+            return empty_state_image('Classificação de Evento - Evolução Temporal', f'Erro: {str(e)}')
 
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def seg_event_g2_plot():
         """Gráfico de evolução temporal - Classificação de Evento - Grupo 2"""
         try:
             # Obter dados de segmentação
-            df_rup = calculate_rup()
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
-            
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            if df_users.empty:
+                return empty_state_image('Classificação de Evento - Grupo 2', 'Nenhum usuário RUP encontrado', fontsize=12)
+            
+            # Coorte com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_cohort()
             if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum dado após filtros temporais', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Classificação de Evento - Grupo 2', 'Nenhum dado após filtros temporais', fontsize=12)
             
-            # Criar grupos baseados nas faixas personalizadas
+            # Grupos das faixas personalizadas (etapa compartilhada de atribuição)
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
-            df_rup['group'] = create_custom_groups(df_rup, var_name, num_groups)
+            df_rup = segmented_cohort()
             
             # Verificar se temos a coluna unique_id
             if 'unique_id' not in df_rup.columns:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Coluna unique_id não encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Classificação de Evento - Grupo 2', 'Coluna unique_id não encontrada', fontsize=12)
             
             # Filtrar apenas usuários do Grupo 2
-            df_g2 = df_rup[df_rup['group'] == 'Grupo 2'].copy()
+            df_g2 = df_rup[df_rup['group'] == 'Grupo 2']
             if df_g2.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário no Grupo 2', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
-            
-            # Obter dados de interações com filtro de X primeiras interações
-            first_interactions_count = input.first_interactions()
-            unique_users_g2 = df_g2['unique_id'].unique()
+                return empty_state_image('Classificação de Evento - Grupo 2', 'Nenhum usuário no Grupo 2', fontsize=12)
             
-            # Aplicar filtros cruzados
-            mask = df_interactions['unique_id'].isin(unique_users_g2)
-            if input.enable_cross_filters():
-                selected_device_types = input.filter_device_types()
-                selected_event_classes = input.filter_event_classes()
-                if selected_device_types:
-                    mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
-                if selected_event_classes:
-                    mask &= df_interactions['event_classification'].isin(selected_event_classes)
+            # Interações do Grupo 2 por classificação de evento e numero_interacao, somadas a partir do
+            # cubo pré-agregado (filtros cruzados e X primeiras interações já aplicados)
+            selected_device_types, selected_event_classes = cross_filter_selection()
+            interactions = cached_interactions(
+                'Grupo 2', df_g2['user_code'], ['event_classification', 'numero_interacao'],
+                first_n=input.first_interactions(), device_types=selected_device_types,
+                event_classes=selected_event_classes)
             
-            # Aplicar filtro de X primeiras interações
-            if 'numero_interacao' in df_interactions.columns:
-                mask &= df_interactions['numero_interacao'] <= first_interactions_count
-            else:
-                # Fallback: usar head() se numero_interacao não existir
-                df_interactions_filtered = df_interactions[mask].copy()
-                df_interactions_filtered = df_interactions_filtered.head(first_interactions_count)
-                mask = df_interactions.index.isin(df_interactions_filtered.index)
-            
-            df_interactions_filtered = df_interactions[mask].copy()
-            
-            if df_interactions_filtered.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
-            
-            # Agrupar por classificação de evento e numero_interacao
-            if 'numero_interacao' in df_interactions_filtered.columns:
-                df_grouped = df_interactions_filtered.groupby(['event_classification', 'numero_interacao']).size().reset_index(name='interaction_count')
-                df_pivot = df_grouped.pivot(index='numero_interacao', columns='event_classification', values='interaction_count').fillna(0)
-            else:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Coluna numero_interacao não encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Classificação de Evento - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
+            yield
             
-            # Limpar memória
-            del df_interactions_filtered
-            gc.collect()
+            interaction_counts = interactions()
+            if interaction_counts.empty:
+                return empty_state_image('Classificação de Evento - Grupo 2', 'Nenhuma interação encontrada', fontsize=12)
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            df_grouped = interaction_counts.reset_index()
+            df_pivot = df_grouped.pivot(index='numero_interacao', columns='event_classification', values='interaction_count').fillna(0)
             
-            fig, ax = plt.subplots(figsize=(3, 4))
+            fig, ax = figure_subplots(figsize=(3, 4))
             
             # Usar cores padronizadas para eventos
             event_colors = {
@@ -3326,70 +4324,56 @@ def server(input, output, session):
             ax.spines['top'].set_visible(False)
             ax.spines['right'].set_visible(False)
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de classificação de eventos G2: {e}")
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Classificação de Evento - Grupo 2', fontsize=12, fontweight='bold')
-            return fig
+            return empty_state_image('Classificação de Evento - Grupo 2', f'Erro: {str(e)}', fontsize=12)
 
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def seg_device_temporal_plot():
         """Gráfico de evolução temporal - Tipo de Dispositivo - Todos os Grupos"""
         try:
             # Verificar se o botão foi clicado
             if not input.calculate_btn():
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.text(0.5, 0.5, 'Clique em "Calcular Gráficos" para visualizar os dados', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Evolução Temporal', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Tipo de Dispositivo - Evolução Temporal', 'Clique em "Calcular Gráficos" para visualizar os dados')
             
             # Obter dados de segmentação
-            df_rup = calculate_rup()
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Evolução Temporal', fontsize=14, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
+            if df_users.empty:
+                return empty_state_image('Tipo de Dispositivo - Evolução Temporal', 'Nenhum usuário RUP encontrado')
             
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
-            
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            # Coorte com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_cohort()
             
             if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.text(0.5, 0.5, 'Nenhum dado após filtros temporais', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Evolução Temporal', fontsize=14, fontweight='bold')
-                return fig
+                return empty_state_image('Tipo de Dispositivo - Evolução Temporal', 'Nenhum dado após filtros temporais')
             
-            # Criar grupos baseados nas faixas personalizadas
+            # Grupos das faixas personalizadas (etapa compartilhada de atribuição)
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
-            df_rup['group'] = create_custom_groups(df_rup, var_name, num_groups)
+            df_rup = segmented_cohort()
             
             # Obter grupos únicos
             unique_groups = sorted(df_rup['group'].unique())
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            # Aplicar escala proporcional se selecionada
+            chart_scale = input.chart_scale()
+            y_axis_max = input.y_axis_max()
+            
+            # Interações por grupo, tipo de dispositivo e numero_interacao, somadas uma única vez a partir
+            # do cubo pré-agregado (filtros cruzados e X primeiras interações já aplicados)
+            selected_device_types, selected_event_classes = cross_filter_selection()
+            interactions = cached_interactions(
+                'cohort', df_rup['user_code'], ['group', 'user_agent_device_type', 'numero_interacao'],
+                first_n=input.first_interactions(), device_types=selected_device_types,
+                event_classes=selected_event_classes, groups=df_rup['group'])
+            
+            yield
             
             # Criar subplots com mais largura e menos distanciamento
-            fig, axes = plt.subplots(nrows=1, ncols=len(unique_groups), figsize=(4*len(unique_groups), 4))
+            fig, axes = figure_subplots(nrows=1, ncols=len(unique_groups), figsize=(4*len(unique_groups), 4))
             if len(unique_groups) == 1:
                 axes = [axes]
             
@@ -3402,8 +4386,11 @@ def server(input, output, session):
                 'console': GLOBAL_COLORS['device_console']
             }
             
-            # Aplicar escala proporcional se selecionada
-            chart_scale = input.chart_scale()
+            interaction_counts = interactions()
+            group_interactions = {
+                group: counts.droplevel('group').reset_index()
+                for group, counts in interaction_counts.groupby(level='group')
+            }
             
             # Primeiro, calcular valores máximos para padronizar escalas
             max_y_value = 0
@@ -3411,33 +4398,14 @@ def server(input, output, session):
             all_device_types = set()
             
             for group in unique_groups:
-                df_group = df_rup[df_rup['group'] == group].copy()
+                df_group = df_rup[df_rup['group'] == group]
                 if df_group.empty:
                     continue
                 
-                # Filtrar interações para usuários do grupo
-                unique_users_group = set(df_group['unique_id'].unique())
-                mask = df_interactions['unique_id'].isin(unique_users_group)
-                
-                # Aplicar filtros cruzados se habilitados
-                if input.enable_cross_filters():
-                    selected_device_types = input.filter_device_types()
-                    if selected_device_types:
-                        mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
-                    
-                    selected_event_classes = input.filter_event_classes()
-                    if selected_event_classes:
-                        mask &= df_interactions['event_classification'].isin(selected_event_classes)
-                
-                # Aplicar filtro de X primeiras interações
-                first_interactions_count = input.first_interactions()
-                if 'numero_interacao' in df_interactions.columns:
-                    mask &= df_interactions['numero_interacao'] <= first_interactions_count
-                
-                df_interactions_filtered = df_interactions[mask].copy()
+                # Interações do grupo já agregadas por tipo de dispositivo e numero_interacao
+                df_grouped = group_interactions.get(group)
                 
-                if not df_interactions_filtered.empty and 'numero_interacao' in df_interactions_filtered.columns:
-                    df_grouped = df_interactions_filtered.groupby(['user_agent_device_type', 'numero_interacao']).size().reset_index(name='interaction_count')
+                if df_grouped is not None:
                     df_pivot = df_grouped.pivot(index='numero_interacao', columns='user_agent_device_type', values='interaction_count').fillna(0)
                     
                     # Aplicar escala proporcional se selecionada
@@ -3454,41 +4422,22 @@ def server(input, output, session):
                 ax = axes[i]
                 
                 # Filtrar usuários do grupo atual
-                df_group = df_rup[df_rup['group'] == group].copy()
+                df_group = df_rup[df_rup['group'] == group]
                 if df_group.empty:
                     ax.text(0.5, 0.5, f'Nenhum usuário do {group}', ha='center', va='center', transform=ax.transAxes)
                     ax.set_title(f'{group}', fontsize=12, fontweight='bold', color='#8A2BE2')
                     continue
                 
-                # Filtrar interações para usuários do grupo
-                unique_users_group = set(df_group['unique_id'].unique())
-                mask = df_interactions['unique_id'].isin(unique_users_group)
-                
-                # Aplicar filtros cruzados se habilitados
-                if input.enable_cross_filters():
-                    selected_device_types = input.filter_device_types()
-                    if selected_device_types:
-                        mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
-                    
-                    selected_event_classes = input.filter_event_classes()
-                    if selected_event_classes:
-                        mask &= df_interactions['event_classification'].isin(selected_event_classes)
-                
-                # Aplicar filtro de X primeiras interações
-                first_interactions_count = input.first_interactions()
-                if 'numero_interacao' in df_interactions.columns:
-                    mask &= df_interactions['numero_interacao'] <= first_interactions_count
-                
-                df_interactions_filtered = df_interactions[mask].copy()
+                # Interações do grupo já agregadas (cubo pré-agregado)
+                df_grouped = group_interactions.get(group)
                 
-                if df_interactions_filtered.empty:
+                if df_grouped is None:
                     ax.text(0.5, 0.5, 'Nenhuma interação encontrada', ha='center', va='center', transform=ax.transAxes)
                     ax.set_title(f'{group}', fontsize=12, fontweight='bold', color='#8A2BE2')
                     continue
                 
                 # Agrupar por tipo de dispositivo e numero_interacao
-                if 'numero_interacao' in df_interactions_filtered.columns:
-                    df_grouped = df_interactions_filtered.groupby(['user_agent_device_type', 'numero_interacao']).size().reset_index(name='interaction_count')
+                if 'numero_interacao' in df_grouped.columns:
                     df_pivot = df_grouped.pivot(index='numero_interacao', columns='user_agent_device_type', values='interaction_count').fillna(0)
                     
                     # Aplicar escala proporcional se selecionada
@@ -3524,7 +4473,7 @@ def server(input, output, session):
                     if chart_scale == "proportional":
                         ax.set_ylim(0, 1)
                     else:
-                        y_max = input.y_axis_max() if input.y_axis_max() else max_y_value * 1.1
+                        y_max = y_axis_max if y_axis_max else max_y_value * 1.1
                         ax.set_ylim(0, y_max)
                     if max_x_value > 0:
                         ax.set_xlim(0, max_x_value + 1)
@@ -3536,118 +4485,59 @@ def server(input, output, session):
                     ax.text(0.5, 0.5, 'Coluna numero_interacao não encontrada', ha='center', va='center', transform=ax.transAxes)
                     ax.set_title(f'{group}', fontsize=12, fontweight='bold', color='#8A2BE2')
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de tipo de dispositivo temporal: {e}")
-            fig, ax = plt.subplots(figsize=(10, 4))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Tipo de Dispositivo - Evolução Temporal', fontsize=14, fontweight='bold')
-            return fig
+            return empty_state_image('Tipo de Dispositivo - Evolução Temporal', f'Erro: {str(e)}')
 
     @output
-    @render.plot
+    @offloaded_plot(input.calculate_btn)
     def seg_device_g2_plot():
         """Gráfico de evolução temporal - Tipo de Dispositivo - Grupo 2"""
         try:
             # Obter dados de segmentação
-            df_rup = calculate_rup()
-            if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário RUP encontrado', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
-            
-            # Aplicar filtros temporais
-            if input.show_rup_only():
-                df_rup = df_rup[df_rup['in_RUP'] == True].copy()
-            
-            if input.show_post_mari():
-                df_rup = df_rup[df_rup['first_seen'] >= '2024-08-01'].copy()
-            
-            # Aplicar filtro de data
-            date_range = input.date_range()
-            if date_range and len(date_range) == 2:
-                start_date, end_date = date_range
-                df_rup['first_seen'] = pd.to_datetime(df_rup['first_seen']).dt.tz_localize(None)
-                df_rup = df_rup[(df_rup['first_seen'].dt.date >= start_date) & (df_rup['first_seen'].dt.date <= end_date)].copy()
+            if df_users.empty:
+                return empty_state_image('Tipo de Dispositivo - Grupo 2', 'Nenhum usuário RUP encontrado', fontsize=12)
+            
+            # Coorte com filtros temporais já aplicados (etapa compartilhada)
+            df_rup = filtered_cohort()
             if df_rup.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum dado após filtros temporais', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Tipo de Dispositivo - Grupo 2', 'Nenhum dado após filtros temporais', fontsize=12)
             
-            # Criar grupos baseados nas faixas personalizadas
+            # Grupos das faixas personalizadas (etapa compartilhada de atribuição)
             var_name = input.segmentation_variable()
             num_groups = input.num_groups()
-            df_rup['group'] = create_custom_groups(df_rup, var_name, num_groups)
+            df_rup = segmented_cohort()
             
             # Verificar se temos a coluna unique_id
             if 'unique_id' not in df_rup.columns:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Coluna unique_id não encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
+                return empty_state_image('Tipo de Dispositivo - Grupo 2', 'Coluna unique_id não encontrada', fontsize=12)
             
             # Filtrar apenas usuários do Grupo 2
-            df_g2 = df_rup[df_rup['group'] == 'Grupo 2'].copy()
+            df_g2 = df_rup[df_rup['group'] == 'Grupo 2']
             if df_g2.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhum usuário no Grupo 2', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
-            
-            # Obter dados de interações com filtro de X primeiras interações
-            first_interactions_count = input.first_interactions()
-            unique_users_g2 = df_g2['unique_id'].unique()
+                return empty_state_image('Tipo de Dispositivo - Grupo 2', 'Nenhum usuário no Grupo 2', fontsize=12)
             
-            # Aplicar filtros cruzados
-            mask = df_interactions['unique_id'].isin(unique_users_g2)
-            if input.enable_cross_filters():
-                selected_device_types = input.filter_device_types()
-                selected_event_classes = input.filter_event_classes()
-                if selected_device_types:
-                    mask &= df_interactions['user_agent_device_type'].isin(selected_device_types)
-                if selected_event_classes:
-                    mask &= df_interactions['event_classification'].isin(selected_event_classes)
+            # Interações do Grupo 2 por tipo de dispositivo e numero_interacao, somadas a partir do
+            # cubo pré-agregado (filtros cruzados e X primeiras interações já aplicados)
+            selected_device_types, selected_event_classes = cross_filter_selection()
+            interactions = cached_interactions(
+                'Grupo 2', df_g2['user_code'], ['user_agent_device_type', 'numero_interacao'],
+                first_n=input.first_interactions(), device_types=selected_device_types,
+                event_classes=selected_event_classes)
             
-            # Aplicar filtro de X primeiras interações
-            if 'numero_interacao' in df_interactions.columns:
-                mask &= df_interactions['numero_interacao'] <= first_interactions_count
-            else:
-                # Fallback: usar head() se numero_interacao não existir
-                df_interactions_filtered = df_interactions[mask].copy()
-                df_interactions_filtered = df_interactions_filtered.head(first_interactions_count)
-                mask = df_interactions.index.isin(df_interactions_filtered.index)
-            
-            df_interactions_filtered = df_interactions[mask].copy()
-            
-            if df_interactions_filtered.empty:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Nenhuma interação encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
-            
-            # Agrupar por tipo de dispositivo e numero_interacao
-            if 'numero_interacao' in df_interactions_filtered.columns:
-                df_grouped = df_interactions_filtered.groupby(['user_agent_device_type', 'numero_interacao']).size().reset_index(name='interaction_count')
-                df_pivot = df_grouped.pivot(index='numero_interacao', columns='user_agent_device_type', values='interaction_count').fillna(0)
-            else:
-                fig, ax = plt.subplots(figsize=(3, 4))
-                ax.text(0.5, 0.5, 'Coluna numero_interacao não encontrada', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title('Tipo de Dispositivo - Grupo 2', fontsize=12, fontweight='bold')
-                return fig
+            yield
             
-            # Limpar memória
-            del df_interactions_filtered
-            gc.collect()
+            interaction_counts = interactions()
+            if interaction_counts.empty:
+                return empty_state_image('Tipo de Dispositivo - Grupo 2', 'Nenhuma interação encontrada', fontsize=12)
             
-            # Configurar o estilo do matplotlib
-            plt.style.use('default')
-            setup_montserrat_font()
+            df_grouped = interaction_counts.reset_index()
+            df_pivot = df_grouped.pivot(index='numero_interacao', columns='user_agent_device_type', values='interaction_count').fillna(0)
             
-            fig, ax = plt.subplots(figsize=(3, 4))
+            fig, ax = figure_subplots(figsize=(3, 4))
             
             # Usar cores padronizadas para dispositivos
             device_colors = {
@@ -3678,21 +4568,14 @@ def server(input, output, session):
             ax.spines['top'].set_visible(False)
             ax.spines['right'].set_visible(False)
             
-            plt.tight_layout()
+            fig.tight_layout()
             return fig
             
         except Exception as e:
             print(f"Erro no gráfico de tipo de dispositivo G2: {e}")
-            fig, ax = plt.subplots(figsize=(3, 4))
-            ax.text(0.5, 0.5, f'Erro: {str(e)}', ha='center', va='center', transform=ax.transAxes)
-            ax.set_title('Tipo de Dispositivo - Grupo 2', fontsize=12, fontweight='bold')
-        return fig
+            return empty_state_image('Tipo de Dispositivo - Grupo 2', f'Erro: {str(e)}', fontsize=12)
 
 # ======================================================================================
 # 4. CRIA A APLICAÇÃO
 # ======================================================================================
-if __name__ == '__main__':
-    import multiprocessing
-    multiprocessing.freeze_support()
-
 app = App(app_ui, server)
@@ -0,0 +1,63 @@
+# ======================================================================================
+# RASTERIZAÇÃO DE FIGURAS (PROCESSOS DO PLOT_PROCESS_POOL)
+# Módulo leve usado pelo dash_aprendizap: desenha figuras do matplotlib já montadas e retorna
+# a imagem codificada. Os processos do pool são criados por um forkserver (ou spawn) que
+# importa apenas este arquivo, nunca o aplicativo com os dados, e recebem as figuras
+# serializadas com pickle.
+# ======================================================================================
+
+import io
+import os
+import pickle
+import warnings
+
+import matplotlib
+import matplotlib.style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+
+PLOT_MAX_PIXELRATIO = float(os.environ.get('APRENDIZAP_PLOT_MAX_PIXELRATIO', '2'))
+
+# Abaixo desta largura (pixels) o DPI diminui proporcionalmente, até PLOT_MIN_DPI_SCALE
+PLOT_FULL_DPI_WIDTH = 600
+PLOT_MIN_DPI_SCALE = 0.6
+
+def init_worker(style):
+    """Initializer dos processos do pool: mesmo estilo do processo principal (os rcParams lidos
+    no desenho, como svg.fonttype, precisam coincidir)"""
+    matplotlib.style.use(['default', style])
+    warnings.filterwarnings('ignore', category=UserWarning, module='matplotlib.font_manager')
+    warnings.filterwarnings('ignore', message='findfont: Font family.*not found')
+
+def plot_dpi(fig, width):
+    """DPI da figura para a largura da saída (menor em saídas estreitas, para o texto caber)"""
+    return fig.get_dpi() * min(1.0, max(PLOT_MIN_DPI_SCALE, width / PLOT_FULL_DPI_WIDTH))
+
+def figure_bytes(fig, width, height, pixelratio, fmt):
+    """Desenha a figura no tamanho do contêiner (como o render.plot) e retorna a imagem codificada"""
+    dpi = plot_dpi(fig, width)
+    ratio = 1 if fmt == 'svg' else min(pixelratio, PLOT_MAX_PIXELRATIO)
+    fig.set_size_inches(width / dpi, height / dpi)
+    fig.set_dpi(dpi * ratio)
+    if fig.get_layout_engine() is None:
+        fig.set_layout_engine(layout='tight')
+    canvas = FigureCanvasAgg(fig)
+    with io.BytesIO() as buf:
+        if fmt in ('png', 'svg'):
+            fig.savefig(buf, format=fmt, dpi=dpi * ratio)
+        else:
+            canvas.draw()
+            image = Image.frombuffer('RGBA', canvas.get_width_height(physical=True), canvas.buffer_rgba())
+            if fmt == 'webp':
+                image.save(buf, format='webp', lossless=True)
+            else:
+                image.convert('RGB').quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, format='png', optimize=True)
+        return buf.getvalue()
+
+def pickled_figure_bytes(data, width, height, pixelratio, fmt):
+    """figure_bytes a partir da figura serializada (executado no processo do pool)"""
+    fig = pickle.loads(data)
+    try:
+        return figure_bytes(fig, width, height, pixelratio, fmt)
+    finally:
+        fig.clear()